@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""A fake Newbie Contest site to run the file system against without the
+network. The pages are made from the templates in fixtures/, which reproduce
+the markup of the real pages, with generated categories and challenges.
+
+The latency of the responses, the rate of 403 errors and the lifetime of the
+sessions can be chosen to reproduce the conditions of the real site."""
+
+import os
+import time
+import random
+import string
+import urlparse
+import optparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+
+fixturesdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def fixture(name):
+    with open(os.path.join(fixturesdir, name + ".html"), "rb") as f:
+        return string.Template(f.read())
+
+
+
+class Site(object):
+    """The content of the site. Everything is generated from seed so that two
+    runs serve the same pages."""
+
+    catnames = ["Web", "Crypto", "Programmation", "Stéganographie",
+            "Logique", "Cracking", "Hacking", "Réseau", "Forensic", "Divers"]
+    words = ["serveur", "message", "chiffré", "clé", "mot", "passe", "page",
+            "fichier", "image", "réseau", "trouver", "caché", "indice",
+            "script", "formulaire", "cookie", "base", "données", "binaire",
+            "algorithme", "secret", "flag", "énigme", "code", "source",
+            "requête", "réponse", "archive", "texte", "nombre", "suite",
+            "lettre", "grille", "carte", "signal", "fréquence", "onde"]
+    months = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet",
+            "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
+    statuses = [
+        ("valide", "Épreuve validée"),
+        ("nonvalide", "Épreuve non validée"),
+    ]
+
+    def __init__(self, ncategories = 8, nchallenges = 40, nnews = 10, seed = 0):
+        rnd = random.Random(seed)
+        self.templates = dict((n, fixture(n)) for n in ["layout",
+            "member-login", "member-infos", "challenges", "challenges-row",
+            "category", "category-row", "challenge", "challenge-afterwards",
+            "challenge-poll", "news", "news-item", "vote"])
+
+        self.categories = []
+        self.challenges = {}
+        for c in range(ncategories):
+            name = self.catnames[c % len(self.catnames)]
+            if c >= len(self.catnames):
+                name += " %d" % (c // len(self.catnames) + 1)
+
+            challs = []
+            for i in range(nchallenges):
+                cid = c * nchallenges + i + 1
+                chall = self.mkchallenge(rnd, cid, "%s %d" % (rnd.choice(self.words).capitalize(), i + 1))
+                self.challenges[cid] = chall
+                challs.append(chall)
+            self.categories.append((c + 1, name, challs))
+
+        self.news = []
+        for i in range(nnews):
+            title = " ".join(rnd.choice(self.words) for _ in range(4)).capitalize()
+            content = self.mktext(rnd, 1, 3)
+            date = "%d %s %d à %02d:%02d:%02d" % (rnd.randint(1, 28),
+                    rnd.choice(self.months), 2010 + i, rnd.randint(0, 23),
+                    rnd.randint(0, 59), rnd.randint(0, 59))
+            self.news.append((title, content, date))
+
+
+    def mktext(self, rnd, minpar, maxpar):
+        pars = []
+        for _ in range(rnd.randint(minpar, maxpar)):
+            sentence = " ".join(rnd.choice(self.words) for _ in range(rnd.randint(20, 120)))
+            pars.append("<p>%s.</p>" % sentence.capitalize())
+        return "\n".join(pars)
+
+
+    def mkchallenge(self, rnd, cid, name):
+        (statusimg, statustitle) = rnd.choice(self.statuses)
+        quality = round(rnd.uniform(0, 10), 1)
+        return {
+            'id': cid,
+            'name': name,
+            'statusimg': statusimg,
+            'statustitle': statustitle,
+            'author': "auteur%d" % rnd.randint(1, 50),
+            'authorid': rnd.randint(1, 5000),
+            'description': self.mktext(rnd, 1, 6),
+            'valids': rnd.randint(1, 3000),
+            'lastuser': "membre%d" % rnd.randint(1, 5000),
+            'lastdate': "%02d/%02d/%d à %02d:%02d" % (rnd.randint(1, 28),
+                rnd.randint(1, 12), rnd.randint(2005, 2016),
+                rnd.randint(0, 23), rnd.randint(0, 59)),
+            'pts': rnd.choice([5, 10, 15, 20, 25, 30, 40, 50]),
+            'quality': quality,
+            'rank': int(quality),
+            'vote': rnd.randint(0, 10),
+            'date': "%02d/%02d/%d" % (rnd.randint(1, 28), rnd.randint(1, 12),
+                rnd.randint(2005, 2016)),
+        }
+
+
+    def layout(self, body, user):
+        if user is None:
+            member = self.templates["member-login"].substitute()
+        else:
+            member = self.templates["member-infos"].substitute(user = user)
+        return self.templates["layout"].substitute(member = member, body = body)
+
+
+    def challengelist(self):
+        rows = []
+        for (cid, name, challs) in self.categories:
+            done = sum(1 for c in challs if c['statusimg'] == "valide")
+            rows.append(self.templates["challenges-row"].substitute(id = cid,
+                name = name, done = done, count = len(challs)))
+        return self.templates["challenges"].substitute(categories = "\n".join(rows))
+
+
+    def category(self, catid):
+        for (cid, name, challs) in self.categories:
+            if cid == catid:
+                break
+        else:
+            return None
+
+        t = self.templates["category-row"]
+        rows = [t.substitute(c) for c in challs]
+        return self.templates["category"].substitute(name = name, rows = "\n".join(rows))
+
+
+    def challenge(self, cid):
+        c = self.challenges.get(cid)
+        if c is None:
+            return None
+
+        afterwards = ""
+        poll = ""
+        if c['statusimg'] == "valide":
+            afterwards = self.templates["challenge-afterwards"].substitute(c)
+            options = []
+            for v in range(11):
+                selected = ' selected="selected"' if v == c['vote'] else ""
+                options.append('<option value="%d"%s>%d</option>' % (v, selected, v))
+            poll = self.templates["challenge-poll"].substitute(c, options = "\n".join(options))
+
+        return self.templates["challenge"].substitute(c, afterwards = afterwards, poll = poll)
+
+
+    def newslist(self):
+        t = self.templates["news-item"]
+        items = [t.substitute(title = title, content = content, date = date)
+                for (title, content, date) in self.news]
+        return self.templates["news"].substitute(items = "\n".join(items))
+
+
+    def vote(self, cid, note):
+        c = self.challenges.get(cid)
+        if c is None or c['statusimg'] != "valide" or not note.isdigit():
+            return None
+        c['vote'] = int(note)
+        return self.templates["vote"].substitute(id = cid)
+
+
+    def pages(self):
+        """Return the pages parsed by the file system as tuples (parsing
+        function name, url, body), for the benchmarks that need no server."""
+        pages = [("categories", "index.php?page=challenges", self.challengelist()),
+                ("news", "index.php?page=news", self.newslist())]
+        for (cid, _, _) in self.categories:
+            pages.append(("category", "index.php?page=challenges&cat=%d" % cid, self.category(cid)))
+        for cid in sorted(self.challenges):
+            pages.append(("challenge", "index.php?page=challenges&id=%d" % cid, self.challenge(cid)))
+        return [(kind, url, self.layout(body, "bench")) for (kind, url, body) in pages]
+
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+    def session(self):
+        """Return the user of the session of the request, or None."""
+        cookies = self.headers.getheader("Cookie", "")
+        for c in cookies.split(";"):
+            (name, _, value) = c.strip().partition("=")
+            if name == "PHPSESSID":
+                return self.server.user(value)
+        return None
+
+
+    def reply(self, code, body = None, headers = ()):
+        self.send_response(code)
+        for h in headers:
+            self.send_header(*h)
+        if body is None:
+            body = ""
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def handle_one(self, method):
+        server = self.server
+        server.count("requests")
+        time.sleep(server.latency)
+
+        if server.forbid > 0 and random.random() < server.forbid:
+            server.count("403")
+            self.reply(403, "<h1>403 Forbidden</h1>")
+            return
+
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        data = {}
+        if method == "POST":
+            length = int(self.headers.getheader("Content-Length", 0))
+            data = dict(urlparse.parse_qsl(self.rfile.read(length)))
+
+        site = server.site
+        user = self.session()
+        body = None
+
+        if url.path == "/forums/index.php" and query.get("action") == "login2":
+            if method == "POST" and data.get("user") == server.username and \
+                    data.get("passwrd") == server.password:
+                server.count("logins")
+                token = server.login(server.username)
+                headers = [("Location", "/index.php?page=news"),
+                        ("Set-Cookie", "PHPSESSID=%s; path=/" % token)]
+                self.reply(302, headers = headers)
+                return
+            server.count("failedlogins")
+            body = ""
+
+        elif url.path == "/index.php" and query.get("page") == "news":
+            body = site.newslist()
+
+        elif url.path == "/index.php" and query.get("page") == "challenges":
+            if method == "POST" and query.get("action") == "vote":
+                if user is not None:
+                    body = site.vote(int(query.get("id", 0)), data.get("note", ""))
+            elif "id" in query:
+                body = site.challenge(int(query["id"]))
+            elif "cat" in query:
+                body = site.category(int(query["cat"]))
+            else:
+                body = site.challengelist()
+
+        if body is None:
+            self.reply(404, "<h1>404 Not Found</h1>")
+            return
+
+        self.reply(200, site.layout(body, user))
+
+
+    def do_GET(self):
+        self.handle_one("GET")
+
+    def do_POST(self):
+        self.handle_one("POST")
+
+
+
+class FakeSite(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serve a Site. The sessions expire after sessionlife seconds if given,
+    and a request fails with a 403 error with the probability forbid."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, site, latency = 0.0, forbid = 0.0,
+            sessionlife = None, username = "bench", password = "bench"):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.site = site
+        self.latency = latency
+        self.forbid = forbid
+        self.sessionlife = sessionlife
+        self.username = username
+        self.password = password
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.counters = {}
+
+
+    @property
+    def urlbase(self):
+        (host, port) = self.server_address
+        return "http://%s:%d/" % (host, port)
+
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+    def login(self, user):
+        token = "%032x" % random.getrandbits(128)
+        with self.lock:
+            self.sessions[token] = (user, time.time())
+        return token
+
+
+    def user(self, token):
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+
+            (user, start) = session
+            if self.sessionlife is not None and time.time() - start > self.sessionlife:
+                del self.sessions[token]
+                self.counters["expired"] = self.counters.get("expired", 0) + 1
+                return None
+            return user
+
+
+    def expire(self):
+        """End all the sessions now."""
+        with self.lock:
+            self.sessions.clear()
+
+
+    def start(self):
+        """Serve in a background thread."""
+        t = threading.Thread(target = self.serve_forever, name = "fakesite")
+        t.daemon = True
+        t.start()
+        return t
+
+
+
+def addoptions(parser):
+    parser.add_option("--latency", metavar = "SECS", type = "float", default = 0.05,
+            help = "answer every request after SECS [default: %default]")
+    parser.add_option("--forbid", metavar = "RATE", type = "float", default = 0.0,
+            help = "answer 403 to a proportion RATE of the requests [default: %default]")
+    parser.add_option("--sessionlife", metavar = "SECS", type = "float",
+            help = "end the sessions after SECS [default: never]")
+    parser.add_option("--categories", metavar = "N", type = "int", default = 8,
+            help = "generate N categories [default: %default]")
+    parser.add_option("--challenges", metavar = "N", type = "int", default = 40,
+            help = "generate N challenges per category [default: %default]")
+    parser.add_option("--seed", metavar = "N", type = "int", default = 0,
+            help = "seed of the generated content [default: %default]")
+
+
+def fromoptions(opts, address):
+    site = Site(opts.categories, opts.challenges, seed = opts.seed)
+    return FakeSite(address, site, opts.latency, opts.forbid, opts.sessionlife)
+
+
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("--port", metavar = "PORT", type = "int", default = 8080,
+            help = "listen on PORT [default: %default]")
+    addoptions(parser)
+    (opts, args) = parser.parse_args()
+
+    server = fromoptions(opts, ("127.0.0.1", opts.port))
+    print "Serving on %s, username and password: %s / %s" % (server.urlbase,
+            server.username, server.password)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    for (k, v) in sorted(server.stats().items()):
+        print "%s: %d" % (k, v)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure the memory used by the file objects of a synthetic tree of
+challenges, with the slotted classes of fileobjects and with the layout they
+had before: a fuse.Stat keeping every field in its __dict__ and a File
+keeping its attributes in its __dict__.
+
+Each tree is built in its own process so that the resident memory measured
+isn't blurred by what the previous one left behind."""
+
+import os
+import sys
+import time
+import optparse
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fileobjects as fo
+
+
+
+# The files of a challenge whose page has been downloaded
+challfiles = ["url", "status", "name", "validations", "points", "quality",
+        "summary", "author", "description", "description.html", "helpurl",
+        "afterwardsurl", "lastvalidation", "vote", "vote.status"]
+
+
+
+class DictStat(object):
+    """The stat of a file before the slots, as fuse.Stat initializes it."""
+
+    def __init__(self):
+        self.st_mode = None
+        self.st_ino = 0
+        self.st_dev = 0
+        self.st_nlink = None
+        self.st_uid = 0
+        self.st_gid = 0
+        self.st_size = 0
+        self.st_atime = 0
+        self.st_mtime = 0
+        self.st_ctime = 0
+
+        self.st_uid = os.getuid()
+        self.st_gid = os.getgid()
+        self.st_atime = int(time.time())
+        self.st_mtime = self.st_atime
+        self.st_ctime = self.st_atime
+        self.st_mode = 0100444
+        self.st_nlink = 1
+
+
+
+class DictFile(object):
+    """A file before the slots."""
+
+    def __init__(self, name, content = b''):
+        self.stat = DictStat()
+        self.name = name
+        self._content = content
+        self.stat.st_size = len(content)
+
+
+
+def build(nchalls, filecls):
+    """Build a tree of nchalls challenges in 20 categories. The contents are
+    shared so that only the objects are measured."""
+    tree = {}
+    for i in range(nchalls):
+        cat = tree.setdefault("category %d" % (i % 20), {})
+        cat["challenge %d" % i] = dict((n, filecls(n, content = b"content\n")) for n in challfiles)
+    return tree
+
+
+def resident():
+    """Return the resident memory of the process in bytes."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def objsize(obj):
+    """Return the size of an object, its __dict__ and its stat if any."""
+    size = sys.getsizeof(obj)
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    st = getattr(obj, '_stat', None) or getattr(obj, 'stat', None)
+    if st is not None and st is not obj:
+        size += objsize(st)
+    return size
+
+
+def measure(args):
+    (nchalls, slots) = args
+    filecls = fo.File if slots else DictFile
+
+    before = resident()
+    tree = build(nchalls, filecls)
+    rss = resident() - before
+
+    nfiles = 0
+    size = 0
+    for cat in tree.values():
+        for files in cat.values():
+            for f in files.values():
+                nfiles += 1
+                size += objsize(f)
+    return (nfiles, size, rss)
+
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("--challenges", metavar = "N", type = "int", default = 2000,
+            help = "build a tree of N challenges [default: %default]")
+    (opts, args) = parser.parse_args()
+
+    pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+    try:
+        for (label, slots) in [("before slots", False), ("with slots", True)]:
+            (nfiles, size, rss) = pool.apply(measure, ((opts.challenges, slots),))
+            print "%-12s %d files: objects %6.2f MB (%3d B/file), resident %6.2f MB" % (
+                    label, nfiles, size / 2.0**20, size // nfiles, rss / 2.0**20)
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Parse the pages of the fake site several times from several threads, as
+the fuse threads do, in the calling threads (parseprocs=0) and in a pool of
+processes (parseprocs=N)."""
+
+import os
+import sys
+import time
+import optparse
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import fakesite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import modules.pages as pages
+
+
+
+# What the extraction functions need from a requests response
+Response = collections.namedtuple('Response', ['content', 'url'])
+
+
+
+def bench(parser, responses, threads, rounds):
+    """Parse every response rounds times with threads threads. Return the
+    number of pages parsed per second."""
+    jobs = responses * rounds
+    pool = ThreadPool(threads)
+    try:
+        start = time.time()
+        pool.map(lambda job: parser.parse(*job), jobs, chunksize = 1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+    return len(jobs) / elapsed
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("--rounds", metavar = "N", type = "int", default = 5,
+            help = "parse every page N times [default: %default]")
+    parser.add_option("--threads", metavar = "N", type = "int", default = 20,
+            help = "parse from N threads [default: %default]")
+    parser.add_option("--procs", metavar = "N", type = "int", default = cores,
+            help = "compare with a pool of N processes [default: %default]")
+    parser.add_option("--categories", metavar = "N", type = "int", default = 8,
+            help = "generate N categories [default: %default]")
+    parser.add_option("--challenges", metavar = "N", type = "int", default = 40,
+            help = "generate N challenges per category [default: %default]")
+    (opts, args) = parser.parse_args()
+
+    site = fakesite.Site(opts.categories, opts.challenges)
+    base = "http://127.0.0.1/"
+    responses = []
+    for (kind, url, body) in site.pages():
+        responses.append((getattr(pages, kind), Response(body, base + url)))
+    print "%d pages, %d rounds, %d threads" % (len(responses), opts.rounds, opts.threads)
+
+    p = pages.PageParser()
+    print "parseprocs=0: %8.1f pages/s" % bench(p, responses, opts.threads, opts.rounds)
+
+    p.startpool(opts.procs)
+    try:
+        rate = bench(p, responses, opts.threads, opts.rounds)
+    finally:
+        p.stoppool()
+    print "parseprocs=%d: %8.1f pages/s" % (opts.procs, rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Mount the file system on the fake site and time the usual ways to browse
+it: ls -lR, find, cat of the descriptions in parallel and the same after all
+the sessions expired."""
+
+import os
+import sys
+import time
+import optparse
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+import fakesite
+
+
+
+rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fsscript = os.path.join(rootdir, "newbiecontest-fuse.py")
+
+
+
+class Bench(object):
+    def __init__(self, server, mountpoint, threads):
+        self.server = server
+        self.mountpoint = mountpoint
+        self.threads = threads
+        self.devnull = open(os.devnull, "wb")
+
+
+    def path(self, *parts):
+        return os.path.join(self.mountpoint, *parts)
+
+
+    def writefile(self, path, content):
+        with open(self.path(path), "wb") as f:
+            f.write(content)
+
+
+    def run(self, name, func):
+        """Run func and print how long it took and how many requests and
+        logins it made."""
+        before = self.server.stats()
+        start = time.time()
+        files = func()
+        elapsed = time.time() - start
+        after = self.server.stats()
+
+        delta = lambda k: after.get(k, 0) - before.get(k, 0)
+        line = "%-22s %8.2fs %6d requests %4d logins %4d 403" % (name, elapsed,
+                delta("requests"), delta("logins"), delta("403"))
+        if files is not None:
+            line += " %8.1f files/s" % (files / elapsed)
+        print line
+
+
+    def invalidate(self):
+        self.writefile(".control/invalidate", "challenges\n")
+
+
+    def command(self, *args):
+        subprocess.check_call(args, stdout = self.devnull)
+
+
+    def descriptions(self):
+        challs = self.path("challenges")
+        paths = []
+        for cat in sorted(os.listdir(challs)):
+            catpath = os.path.join(challs, cat)
+            if not os.path.isdir(catpath):
+                continue
+            for chall in sorted(os.listdir(catpath)):
+                paths.append(os.path.join(catpath, chall, "description"))
+        return paths
+
+
+    def cat(self, paths):
+        def read(path):
+            with open(path, "rb") as f:
+                return len(f.read())
+
+        pool = ThreadPool(self.threads)
+        try:
+            pool.map(read, paths)
+        finally:
+            pool.close()
+        return len(paths)
+
+
+    def all(self):
+        challs = self.path("challenges")
+        self.writefile("username", self.server.username)
+        self.writefile("password", self.server.password)
+
+        self.run("ls -lR (cold)", lambda: self.command("ls", "-lR", challs))
+        self.run("ls -lR (warm)", lambda: self.command("ls", "-lR", challs))
+        self.run("find (warm)", lambda: self.command("find", challs, "-type", "f"))
+        self.invalidate()
+        self.run("find (invalidated)", lambda: self.command("find", challs, "-type", "f"))
+
+        paths = self.descriptions()
+        self.invalidate()
+        self.run("cat x%d (invalidated)" % self.threads, lambda: self.cat(paths))
+        self.run("cat x%d (warm)" % self.threads, lambda: self.cat(paths))
+
+        self.server.expire()
+        self.invalidate()
+        self.run("cat x%d (reauth)" % self.threads, lambda: self.cat(paths))
+
+
+
+def mount(mountpoint, urlbase, options):
+    opts = "urlbase=" + urlbase
+    if options is not None:
+        opts += "," + options
+    proc = subprocess.Popen([sys.executable, fsscript, mountpoint, "-f", "-o", opts])
+
+    for _ in range(100):
+        if os.path.ismount(mountpoint):
+            return proc
+        if proc.poll() is not None:
+            raise RuntimeError("the file system exited with status %d" % proc.returncode)
+        time.sleep(0.1)
+
+    proc.terminate()
+    raise RuntimeError("the file system was not mounted after 10 seconds")
+
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] MOUNTPOINT")
+    fakesite.addoptions(parser)
+    parser.add_option("--threads", metavar = "N", type = "int", default = 8,
+            help = "read N files at a time [default: %default]")
+    parser.add_option("-o", dest = "options", metavar = "OPTIONS",
+            help = "add OPTIONS to the mount options")
+    (opts, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("a mount point is required")
+    mountpoint = os.path.abspath(args[0])
+
+    server = fakesite.fromoptions(opts, ("127.0.0.1", 0))
+    server.start()
+
+    proc = mount(mountpoint, server.urlbase, opts.options)
+    try:
+        Bench(server, mountpoint, opts.threads).all()
+    finally:
+        subprocess.call(["fusermount", "-u", mountpoint])
+        proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+import time
+import errno
+import threading
+import contextlib
+
+
+
+# Maximum duration of a file operation in seconds, None for no limit
+limit = None
+
+_tls = threading.local()
+
+
+
+class DeadlineExceeded(IOError):
+    """Raised when the file operation ran out of time. fuse returns EAGAIN."""
+
+    def __init__(self):
+        super(DeadlineExceeded, self).__init__(errno.EAGAIN, "Deadline exceeded")
+
+
+
+@contextlib.contextmanager
+def bound(secs = None):
+    """Context manager setting a deadline for the current thread, secs from
+    now or limit if not given. An inner deadline cannot extend an outer
+    one."""
+    if secs is None:
+        secs = limit
+
+    prev = getattr(_tls, 'deadline', None)
+    cur = prev
+    if secs is not None:
+        cur = time.time() + secs
+        if prev is not None:
+            cur = min(cur, prev)
+
+    _tls.deadline = cur
+    try:
+        yield
+    finally:
+        _tls.deadline = prev
+
+
+def remaining():
+    """Return the number of seconds left to the current thread, or None if
+    there is no deadline."""
+    d = getattr(_tls, 'deadline', None)
+    if d is None:
+        return None
+    return d - time.time()
+
+
+def expired():
+    r = remaining()
+    return r is not None and r <= 0
+
+
+def check():
+    """Raise DeadlineExceeded if the current thread ran out of time."""
+    if expired():
+        raise DeadlineExceeded()
+
+
+def cap(secs):
+    """Return secs reduced to the time left to the current thread."""
+    r = remaining()
+    if r is None:
+        return secs
+    if r <= 0:
+        raise DeadlineExceeded()
+    return min(secs, r)
+
+
+
+class Bounded(object):
+    """Wrap a lock or semaphore whose acquire accepts a timeout so that
+    entering it gives up when the current thread runs out of time."""
+
+    __slots__ = ('lock',)
+
+    def __init__(self, lock):
+        self.lock = lock
+
+    def __enter__(self):
+        if not self.lock.acquire(remaining()):
+            raise DeadlineExceeded()
+        return self.lock
+
+    def __exit__(self, t, v, tb):
+        self.lock.release()
@@ -5,14 +5,35 @@ import stat
 import time
 import fuse
 
+import metrics
 
 
-class DefaultStat(fuse.Stat):
-    def __init__(self, *args, **kwargs):
-        super(DefaultStat, self).__init__(*args, **kwargs)
-        # These fields are purely cosmetic
-        self.st_uid = os.getuid()
-        self.st_gid = os.getgid()
+
+# Like with the relatime mount option, the access time is only updated when
+# it's older than the modification time. Setting noatime to True never updates
+# it. This avoids calling time.time() for every chunk read.
+noatime = False
+
+
+
+class DefaultStat(object):
+    """A compact equivalent of fuse.Stat. Only the fields that may differ from
+    one file to another are stored in the instance, the others are shared
+    class attributes."""
+
+    __slots__ = ('st_mode', 'st_nlink', 'st_size',
+            'st_atime', 'st_mtime', 'st_ctime')
+
+    # These fields are purely cosmetic and computed once per process
+    st_uid = os.getuid()
+    st_gid = os.getgid()
+    st_ino = 0
+    st_dev = 0
+
+    def __init__(self):
+        self.st_mode = 0
+        self.st_nlink = 0
+        self.st_size = 0
         self.st_atime = int(time.time())
         self.st_mtime = self.st_atime
         self.st_ctime = self.st_atime
@@ -21,11 +42,18 @@ class DefaultStat(fuse.Stat):
         self.st_atime = int(time.time())
         self.st_mtime = self.st_atime
 
+    def access(self):
+        if noatime or self.st_atime > self.st_mtime:
+            return
+        self.st_atime = int(time.time())
+
 
 
 class DirStat(DefaultStat):
-    def __init__(self, *args, **kwargs):
-        super(DirStat, self).__init__(*args, **kwargs)
+    __slots__ = ()
+
+    def __init__(self):
+        super(DirStat, self).__init__()
         # Those two fields are require
         self.st_mode = stat.S_IFDIR | 0555
         self.st_nlink = 2
@@ -33,22 +61,49 @@ class DirStat(DefaultStat):
 
 
 class FileStat(DefaultStat):
-    def __init__(self, *args, **kwargs):
-        super(FileStat, self).__init__(*args, **kwargs)
+    __slots__ = ()
+
+    def __init__(self):
+        super(FileStat, self).__init__()
         # Those two fields are require
         self.st_mode = stat.S_IFREG | 0444
         self.st_nlink = 1
 
 
 
+class LinkStat(DefaultStat):
+    __slots__ = ()
+
+    def __init__(self, target):
+        super(LinkStat, self).__init__()
+        self.st_mode = stat.S_IFLNK | 0777
+        self.st_nlink = 1
+        self.st_size = len(target)
+
+
+
 class File(object):
-    def __init__(self, name, isWritable = False, content = b''):
-        self.stat = FileStat()
+    """A regular file. The content may either be given directly or be computed
+    by the function provider the first time it is read. Until then, its size
+    is placeholdersize so that a stat doesn't compute it, and the file is
+    opened in direct_io so that the reads don't depend on the size."""
+
+    __slots__ = ('name', '_stat', '_content', '_provider', '_lazy')
+
+    # Whether the file appears in the listing of its directory
+    listed = True
+
+    placeholdersize = 4096
+
+    def __init__(self, name, isWritable = False, content = b'', provider = None):
+        self._stat = FileStat()
         if isWritable:
-            self.stat.st_mode |= 0220
+            self._stat.st_mode |= 0220
         self.name = name
         self._content = content
-        self.stat.st_size = len(content)
+        self._provider = provider
+        self._lazy = provider is not None
+        self._stat.st_size = self.placeholdersize if self._lazy else len(content)
 
     # This is what truncate should do to the content
     @staticmethod
@@ -57,32 +112,110 @@ class File(object):
         s += b'\0' * (size - len(s))
         return s
 
+    def materialize(self):
+        """Compute the content with the provider if it hasn't been done yet."""
+        provider = self._provider
+        if provider is None:
+            return
+
+        with metrics.span("render", self.name):
+            content = provider()
+        self._content = content
+        self._stat.st_size = len(content)
+        self._provider = None
+
+    @property
+    def resident(self):
+        """The size of the content if it has been computed."""
+        if self._provider is not None:
+            return 0
+        return len(self._content)
+
+    @property
+    def stat(self):
+        # The size is the real one once the content has been computed
+        return self._stat
+
     @property
     def content(self):
-        self.stat.st_atime = int(time.time())
+        self.materialize()
+        self._stat.access()
         return self._content
 
     @content.setter
     def content(self, content):
+        self._provider = None
         self._content = content
-        self.stat.st_size = len(content)
-        self.stat.touch()
+        self._stat.st_size = len(content)
+        self._stat.touch()
+
+    # Writes are done in place in a bytearray, converted on the first write
+    def _buffer(self):
+        c = self.content
+        if not isinstance(c, bytearray):
+            c = bytearray(c)
+        return c
+
+    def open(self, flags):
+        """Return None or a fuse.FuseFileInfo giving how to open the file."""
+        # The kernel may still have the placeholder size in its cache
+        if self._lazy:
+            return fuse.FuseFileInfo(direct_io = True)
+        return None
 
     def read(self, size, offset):
-        return self.content[offset:offset+size]
+        c = self.content
+        if isinstance(c, bytearray):
+            # Copy only the slice that is returned
+            return memoryview(c)[offset:offset+size].tobytes()
+        if offset == 0 and size >= len(c):
+            # The whole immutable content is returned without copy
+            return c
+        return c[offset:offset+size]
 
     def write(self, buf, offset):
-        c = self.content
-        c = c[:offset] + bytes(buf) + c[offset+len(buf):]
+        c = self._buffer()
+        if offset > len(c):
+            c.extend(b'\0' * (offset - len(c)))
+        c[offset:offset+len(buf)] = buf
         self.content = c
         return len(buf)
 
     def truncate(self, size):
-        self.content = self.cutextend(self.content, size)
+        c = self._buffer()
+        if size < len(c):
+            del c[size:]
+        else:
+            c.extend(b'\0' * (size - len(c)))
+        self.content = c
+
+
+
+class DynamicFile(File):
+    """A read-only file whose content is generated again by the provider each
+    time its stat is asked, so that the size is consistent with what is read
+    afterwards."""
+
+    __slots__ = ('_generator',)
+
+    def __init__(self, name, provider, **kwargs):
+        super(DynamicFile, self).__init__(name, provider = provider, **kwargs)
+        self._generator = provider
+
+    @property
+    def stat(self):
+        self._provider = self._generator
+        self.materialize()
+        self._stat.touch()
+        return self._stat
 
 
 
 class Directory(object):
+    __slots__ = ('name', 'stat', '_files')
+
+    listed = True
+
     def __init__(self, name, isWritable = False):
         self.stat = DirStat()
         if isWritable:
@@ -92,7 +225,7 @@ class Directory(object):
 
     @property
     def files(self):
-        self.stat.st_atime = int(time.time())
+        self.stat.access()
         return self._files
 
     @files.setter
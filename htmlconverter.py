@@ -0,0 +1,126 @@
+# coding: utf-8
+
+import time
+import hashlib
+import threading
+import collections
+import multiprocessing
+import lxml.html
+
+import metrics
+import deadline
+
+try:
+    import html2text
+except ImportError:
+    html2text = None
+
+
+
+# Has to be a module-level function to be run by the process pool
+def _html2text(html):
+    return html2text.html2text(html).encode('utf-8')
+
+
+def _convert(html):
+    """Run _html2text in a process of the pool. The exceptions are returned
+    rather than raised since the worker of the pool dies on those that don't
+    derive from Exception."""
+    try:
+        return (None, _html2text(html))
+    except BaseException as e:
+        return (e, None)
+
+
+
+class HTMLConverter(object):
+    """Convert HTML to text with html2text, or to raw text if it's not
+    available. The results are memoized in an LRU cache keyed by a hash of
+    the HTML, bounded in entries and in bytes, and the conversions may be run
+    in a pool of processes. The cache is not part of the memory budget."""
+
+    def __init__(self, maxentries = 1024, maxbytes = 16 * 2**20):
+        self.maxentries = maxentries
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+
+        self.hits = 0
+        self.misses = 0
+        self.convtime = 0.0
+
+
+    def startpool(self, nprocs):
+        """Run the next conversions in nprocs processes. Has to be called
+        after fuse daemonized."""
+        self.pool = multiprocessing.Pool(nprocs)
+
+
+    def stoppool(self):
+        pool = self.pool
+        self.pool = None
+        if pool is not None:
+            pool.terminate()
+
+
+    def convert(self, html):
+        if html2text is None:
+            element = lxml.html.fromstring(html)
+            return lxml.html.tostring(element, encoding = 'utf-8', method = 'text')
+
+        key = hashlib.sha1(html).digest()
+
+        with self.lock:
+            text = self.cache.pop(key, None)
+            if text is not None:
+                # Reinsert it as the most recently used
+                self.cache[key] = text
+                self.hits += 1
+                metrics.incr("html2text.hit")
+                return text
+            self.misses += 1
+
+        start = time.time()
+        pool = self.pool
+        with metrics.span("html2text"):
+            if pool is not None:
+                job = pool.apply_async(_convert, (html,))
+                try:
+                    (e, text) = job.get(deadline.remaining())
+                except multiprocessing.TimeoutError:
+                    raise deadline.DeadlineExceeded()
+                if e is not None:
+                    raise e
+            else:
+                text = _html2text(html)
+        elapsed = time.time() - start
+        metrics.observe("html2text", elapsed)
+
+        with self.lock:
+            self.convtime += elapsed
+            if key not in self.cache:
+                self.cache[key] = text
+                self.size += len(text)
+            while len(self.cache) > self.maxentries or self.size > self.maxbytes:
+                (_, old) = self.cache.popitem(last = False)
+                self.size -= len(old)
+        return text
+
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitrate': float(self.hits) / total if total > 0 else 0.0,
+                'convtime': self.convtime,
+                'entries': len(self.cache),
+                'bytes': self.size,
+            }
+
+
+
+converter = HTMLConverter()
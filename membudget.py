@@ -0,0 +1,90 @@
+# coding: utf-8
+
+import threading
+import collections
+
+
+
+class MemoryBudget(object):
+    """Keep track of the memory used by the heavy contents of some objects and
+    evict the least recently used ones when the total exceeds the budget.
+
+    The objects must have a method evict() dropping their heavy content. It
+    may return False if it can't be done right now."""
+
+    def __init__(self, budget = None):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.total = 0
+        self.bykind = {}
+
+
+    def _add(self, owner, size):
+        self.entries[owner] = size
+        self.total += size
+        kind = type(owner).__name__
+        self.bykind[kind] = self.bykind.get(kind, 0) + size
+
+
+    def _remove(self, owner):
+        size = self.entries.pop(owner, None)
+        if size is None:
+            return
+        self.total -= size
+        kind = type(owner).__name__
+        self.bykind[kind] -= size
+
+
+    def use(self, owner, size):
+        """Record that owner uses size bytes and was just used."""
+        with self.lock:
+            self._remove(owner)
+            self._add(owner, size)
+        self.shrink()
+
+
+    def forget(self, owner):
+        with self.lock:
+            self._remove(owner)
+
+
+    def setbudget(self, budget):
+        self.budget = budget
+        self.shrink()
+
+
+    def shrink(self):
+        """Evict the least recently used objects until the budget is met. The
+        most recently used one is always kept."""
+        busy = []
+        while True:
+            with self.lock:
+                if self.budget is None or self.total <= self.budget:
+                    break
+                if len(self.entries) <= 1:
+                    break
+                owner = next(iter(self.entries))
+                size = self.entries[owner]
+                self._remove(owner)
+
+            if owner.evict() is False:
+                busy.append((owner, size))
+
+        # The objects that couldn't be evicted are in use, keep them as the
+        # most recently used ones
+        with self.lock:
+            for (owner, size) in busy:
+                if owner not in self.entries:
+                    self._add(owner, size)
+
+
+    def resident(self):
+        with self.lock:
+            d = dict(self.bykind)
+            d['total'] = self.total
+            return d
+
+
+
+budget = MemoryBudget()
@@ -0,0 +1,270 @@
+# coding: utf-8
+
+import json
+import math
+import time
+import threading
+
+
+
+# Nothing is recorded unless this is set to True
+enabled = False
+
+# When set to a file name, the tree of spans of each fuse operation taking
+# more than slowthreshold seconds is appended to this file
+slowlog = None
+slowthreshold = 1.0
+
+
+
+class Histogram(object):
+    """Count the durations in buckets whose upper bounds are powers of 2
+    milliseconds."""
+
+    nbuckets = 24
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.nbuckets
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        (_, exp) = math.frexp(ms)
+        idx = min(max(exp, 0), self.nbuckets - 1)
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Return the upper bound in milliseconds of the bucket containing the
+        percentile p."""
+        threshold = self.count * p / 100.0
+        acc = 0
+        for (idx, n) in enumerate(self.buckets):
+            acc += n
+            if acc >= threshold:
+                return 2 ** idx
+        return 2 ** (self.nbuckets - 1)
+
+    def todict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': dict((2 ** i, n) for (i, n) in enumerate(self.buckets) if n > 0),
+        }
+
+
+
+class Registry(object):
+    """Hold all the counters and histograms by name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def incr(self, name, n = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = Histogram()
+            h.add(seconds)
+
+    def todict(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict((k, h.todict()) for (k, h) in self.histograms.items()),
+            }
+
+    def rendertext(self):
+        d = self.todict()
+        lines = []
+        for (k, v) in sorted(d['counters'].items()):
+            lines.append("%s %d\n" % (k, v))
+        for (k, h) in sorted(d['histograms'].items()):
+            avg = h['total'] / h['count'] * 1000
+            lines.append("%s count=%d avg=%.2fms max=%.2fms p50<=%dms p99<=%dms\n" %
+                    (k, h['count'], avg, h['max'] * 1000, h['p50'], h['p99']))
+        return b"".join(lines)
+
+    def renderjson(self):
+        return json.dumps(self.todict(), sort_keys = True, indent = 1) + "\n"
+
+
+
+registry = Registry()
+
+
+
+class Span(object):
+    """A traced "with" block and the spans started inside it."""
+
+    __slots__ = ('name', 'detail', 'start', 'end', 'children')
+
+    def __init__(self, name, detail = None):
+        self.name = name
+        self.detail = detail
+        self.start = None
+        self.end = None
+        self.children = []
+
+    def render(self, depth = 0):
+        line = "%s%s %.3fs" % ("  " * depth, self.name, self.end - self.start)
+        if self.detail is not None:
+            line += " " + str(self.detail)
+        lines = [line + "\n"]
+        for c in self.children:
+            lines.append(c.render(depth + 1))
+        return "".join(lines)
+
+
+
+class Tracer(threading.local):
+    """Keep the stack of the spans running in each thread."""
+
+    def __init__(self):
+        super(Tracer, self).__init__()
+        self.stack = []
+
+    def push(self, span):
+        if len(self.stack) > 0:
+            self.stack[-1].children.append(span)
+        self.stack.append(span)
+        span.start = time.time()
+
+    def pop(self):
+        span = self.stack.pop()
+        span.end = time.time()
+        if len(self.stack) == 0 and span.end - span.start >= slowthreshold:
+            self.logslow(span)
+        return span
+
+    def logslow(self, span):
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(span.start))
+        with slowloglock:
+            with open(slowlog, "a") as f:
+                f.write(date + " " + span.render())
+
+
+
+tracer = Tracer()
+slowloglock = threading.Lock()
+
+
+
+class Timer(object):
+    """Record the duration of a "with" block in the histogram name and trace it
+    if the slow log is enabled."""
+
+    __slots__ = ('name', 'start', 'span')
+
+    def __init__(self, name, detail = None):
+        self.name = name
+        self.span = None
+        if slowlog is not None:
+            self.span = Span(name, detail)
+
+    def __enter__(self):
+        if self.span is not None:
+            tracer.push(self.span)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, t, v, tb):
+        if enabled:
+            registry.observe(self.name, time.time() - self.start)
+        if self.span is not None:
+            tracer.pop()
+
+
+
+class Traced(object):
+    """Only trace a "with" block, without histogram."""
+
+    __slots__ = ('span',)
+
+    def __init__(self, name, detail = None):
+        self.span = Span(name, detail)
+
+    def __enter__(self):
+        tracer.push(self.span)
+        return self
+
+    def __exit__(self, t, v, tb):
+        tracer.pop()
+
+
+
+class Waiter(object):
+    """Wrap a context manager and record how long its __enter__ took."""
+
+    __slots__ = ('name', 'cm')
+
+    def __init__(self, name, cm):
+        self.name = name
+        self.cm = cm
+
+    def __enter__(self):
+        start = time.time()
+        ret = self.cm.__enter__()
+        registry.observe(self.name, time.time() - start)
+        return ret
+
+    def __exit__(self, t, v, tb):
+        return self.cm.__exit__(t, v, tb)
+
+
+
+class NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        return
+
+
+
+nulltimer = NullTimer()
+
+
+
+def incr(name, n = 1):
+    if enabled:
+        registry.incr(name, n)
+
+
+def observe(name, seconds):
+    if enabled:
+        registry.observe(name, seconds)
+
+
+def timer(name, detail = None):
+    if enabled or slowlog is not None:
+        return Timer(name, detail)
+    return nulltimer
+
+
+def span(name, detail = None):
+    if slowlog is not None:
+        return Traced(name, detail)
+    return nulltimer
+
+
+def waiting(name, cm):
+    if enabled:
+        return Waiter(name, cm)
+    return cm
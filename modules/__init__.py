@@ -1,10 +1,16 @@
 # coding: utf-8
 
 import errno
-import stat
 import fuse
 import itertools
-
+import time
+import thread
+import hashlib
+import threading
+
+import metrics
+import deadline
+import scheduler as sched
 import fileobjects as fo
 
 
@@ -36,12 +42,36 @@ class FSModule(object):
     def read(self, path, *args, **kwargs):
         return -errno.ENOENT
 
+    def readlink(self, path):
+        return -errno.ENOENT
+
+    def xattrs(self):
+        """Return a dict of the extended attributes of the directory of this
+        module."""
+        return {}
+
+    def getxattr(self, path, name):
+        if path == "":
+            val = self.xattrs().get(name)
+            if val is not None:
+                return val
+        return -errno.ENODATA
+
+    def listxattr(self, path):
+        if path == "":
+            return self.xattrs().keys()
+        return []
+
     def write(self, path, *args, **kwargs):
         return -errno.ENOENT
 
     def truncate(self, path, *args, **kwargs):
         return -errno.ENOENT
 
+    def invalidate(self):
+        """Expire the caches of this module and its submodules."""
+        pass
+
 
 
 class FSSubModule(FSModule):
@@ -73,11 +103,31 @@ class FSSubModule(FSModule):
 
     def modulepath(self, path):
         (prefix, tail) = self.pathsplit(path)
-        if prefix in self.dirmodules:
-            return (self.dirmodules[prefix], tail)
+        m = self.dirmodules.get(prefix)
+        if m is not None:
+            return (m, tail)
         return (self.rootmodule, path)
 
 
+    def submodule(self, path):
+        """Return the module of the directory path or None."""
+        m = self
+        while path != "":
+            if not isinstance(m, FSSubModule):
+                return None
+            (prefix, path) = m.pathsplit(path)
+            m = m.dirmodules.get(prefix)
+            if m is None:
+                return None
+        return m
+
+
+    def invalidate(self):
+        self.rootmodule.invalidate()
+        for m in self.dirmodules.values():
+            m.invalidate()
+
+
     def getndirs(self):
         return self.rootmodule.getndirs() + len(self.dirmodules)
 
@@ -126,6 +176,27 @@ class FSSubModule(FSModule):
         return m.read(tail, *args, **kwargs)
 
 
+    def readlink(self, path):
+        (m, tail) = self.modulepath(path)
+        if tail == "":
+            return -errno.EINVAL
+        return m.readlink(tail)
+
+
+    def getxattr(self, path, name):
+        if path == "":
+            return super(FSSubModule, self).getxattr(path, name)
+        (m, tail) = self.modulepath(path)
+        return m.getxattr(tail, name)
+
+
+    def listxattr(self, path):
+        if path == "":
+            return super(FSSubModule, self).listxattr(path)
+        (m, tail) = self.modulepath(path)
+        return m.listxattr(tail)
+
+
     def write(self, path, *args, **kwargs):
         (m, tail) = self.modulepath(path)
         return m.write(tail, *args, **kwargs)
@@ -141,73 +212,280 @@ class FSSubModuleFiles(FSSubModule):
     """This class handles submodules as well as files, it is ment to be
     inherited to override at least the method updatefiles.
 
+    updatefiles should build the new files and dirmodules aside and publish
+    them at once so that the other threads never see a partial state.
+
     Attributes:
         files    A dict that associate nales to any subclass of File or
-                 Directory."""
+                 Directory.
+        version  The number of times a new state has been published.
+        failures The number of updates that failed in a row.
+        life     The current lifetime of the cache given by nextlife."""
+
+    # Wait failbackoff seconds after a failed update before retrying, twice as
+    # long after each new failure up to failbackoffmax
+    failbackoff = 5
+    failbackoffmax = 3600
+
+    # Longest lifetime given by nextlife to the data that never change
+    maxlife = 3600
 
     def __init__(self, *args, **kwargs):
         self.superself = super(FSSubModuleFiles, self)
         self.superself.__init__(*args, **kwargs)
         self.files = {}
+        self.version = 0
+        self.updatelock = threading.Lock()
+        self.updatecond = threading.Condition(threading.Lock())
+        self.updater = None
+        self.failures = 0
+        self.failexpir = None
+        self.life = None
+        self.digest = None
+
+
+    def invalidate(self):
+        self.failexpir = None
+        self.superself.invalidate()
 
 
     def updatefiles(self):
         pass
 
 
+    def charge(self):
+        """Record the memory used by the cached content, if it's accounted
+        for."""
+        pass
+
+
+    def nextlife(self, data, minlife, maxlife):
+        """Return how long data should be cached. The lifetime doubles each
+        time data is the same as at the previous call, up to maxlife, and is
+        back to minlife as soon as it changes."""
+        digest = hashlib.sha1(repr(data)).digest()
+        if self.life is None or digest != self.digest:
+            life = minlife
+        else:
+            life = self.life * 2
+
+        self.life = max(minlife, min(life, maxlife))
+        self.digest = digest
+        return self.life
+
+
+    def publish(self, files = None, dirmodules = None):
+        """Replace the files and/or the dirmodules by new dicts. They must not
+        be modified afterwards."""
+        if files is not None:
+            self.files = files
+        if dirmodules is not None:
+            self.dirmodules = dirmodules
+        self.version += 1
+
+
+    def refresh(self):
+        """Call updatefiles unless another thread is already doing it. In that
+        case, use the current state if there is one instead of waiting. The
+        current state is also used if the network is too slow.
+
+        When updatefiles fails, the current state is kept with an additional
+        file .error and updatefiles is not called again before a delay."""
+        name = type(self).__name__
+        if not self.beginupdate():
+            metrics.incr("cache.%s.stale" % name)
+            return
+
+        try:
+            if self.failexpir is not None and self.failexpir > time.time():
+                metrics.incr("cache.%s.failed" % name)
+                return
+
+            self._refresh(name)
+            if self.failures > 0:
+                self.recovered()
+        except deadline.DeadlineExceeded:
+            if self.version == 0:
+                raise
+            metrics.incr("cache.%s.stale" % name)
+        except (Exception, ParsingException) as e:
+            self.failed(e)
+        finally:
+            self.endupdate()
+
+
+    def beginupdate(self, stale = True):
+        """Take self.updatelock. If another thread holds it, return False
+        when there is a current state to use and stale is True, otherwise wait
+        for it until the deadline of the current thread. The requests of the
+        updating thread are then served with the priority of the waiting
+        one."""
+        with self.updatecond:
+            while not self.updatelock.acquire(False):
+                if stale and self.version > 0:
+                    return False
+
+                left = deadline.remaining()
+                if left is not None and left <= 0:
+                    raise deadline.DeadlineExceeded()
+                if self.updater is not None:
+                    sched.fetches.boost(self.updater, sched.current())
+                self.updatecond.wait(left)
+
+            self.updater = thread.get_ident()
+        return True
+
+
+    def endupdate(self):
+        """Release self.updatelock and wake the threads waiting for it."""
+        with self.updatecond:
+            updater = self.updater
+            self.updater = None
+            self.updatelock.release()
+            self.updatecond.notify_all()
+
+        if updater is not None:
+            sched.fetches.unboost(updater)
+
+
+    # Has to be called with self.updatelock held
+    def recovered(self):
+        """Forget the previous failures after a successful update."""
+        self.failures = 0
+        self.failexpir = None
+        if ".error" in self.files:
+            files = dict(self.files)
+            del files[".error"]
+            self.publish(files = files)
+
+
+    # Has to be called with self.updatelock held
+    def failed(self, e):
+        """Keep the current state with a file describing the failure e and
+        set the delay before the next update."""
+        metrics.incr("error.%s" % type(self).__name__)
+        self.failures += 1
+        delay = min(self.failbackoff * 2 ** (self.failures - 1), self.failbackoffmax)
+        self.failexpir = time.time() + delay
+
+        retry = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(self.failexpir))
+        msg = "error: %s\n" % (repr(e),)
+        msg += "failures: %d\n" % self.failures
+        msg += "next retry: %s\n" % retry
+
+        files = self.keptfiles()
+        files[".error"] = fo.File(".error", content = bytes(msg))
+        self.publish(files = files)
+
+
+    def keptfiles(self):
+        """Return the files to keep published when an update failed."""
+        return dict(self.files)
+
+
+    def _refresh(self, name):
+        with metrics.span("update.%s" % name):
+            if not metrics.enabled:
+                self.updatefiles()
+                return
+
+            version = self.version
+            start = time.time()
+            self.updatefiles()
+            if self.version != version:
+                metrics.incr("cache.%s.miss" % name)
+                metrics.observe("update.%s" % name, time.time() - start)
+            else:
+                metrics.incr("cache.%s.hit" % name)
+
+
     def getndirs(self):
-        self.updatefiles()
+        self.refresh()
 
+        # Don't look at the stat of the files, it would compute their content
         count = 0
         for f in self.files.values():
-            if f.stat.st_mode & stat.S_IFDIR:
+            if isinstance(f, fo.Directory):
                 count += 1
         return count + self.superself.getndirs()
 
 
     def getattr(self, path):
-        self.updatefiles()
-        if path in self.files:
-            return self.files[path].stat
+        self.refresh()
+        f = self.files.get(path)
+        if f is not None:
+            return f.stat
 
         return self.superself.getattr(path)
 
 
     def readdir(self, path, offset):
-        self.updatefiles()
+        self.refresh()
 
         otherfiles = self.superself.readdir(path, offset)
         if path != "":
             return otherfiles
 
-        myfiles = (fuse.Direntry(f.name) for f in self.files.values())
+        myfiles = (fuse.Direntry(f.name) for f in self.files.values() if f.listed)
         return itertools.chain(otherfiles, myfiles)
 
 
     def open(self, path, flags):
-        self.updatefiles()
-
-        if path not in self.files:
-            return self.superself.open(path, flags)
+        self.refresh()
+        f = self.files.get(path)
+        if f is not None:
+            return f.open(flags)
+        return self.superself.open(path, flags)
 
 
     def read(self, path, size, offset):
-        self.updatefiles()
-        if path in self.files:
-            return self.files[path].read(size, offset)
+        self.refresh()
+        f = self.files.get(path)
+        if f is not None:
+            return f.read(size, offset)
         return self.superself.read(path, size, offset)
 
 
-    def write(self, path, buf, offset):
-        self.updatefiles()
+    def readlink(self, path):
+        self.refresh()
         if path in self.files:
-            return self.files[path].write(buf, offset)
+            return -errno.EINVAL
+        return self.superself.readlink(path)
+
+
+    # The attributes of the directory itself don't need an update
+    def getxattr(self, path, name):
+        if path == "":
+            return self.superself.getxattr(path, name)
+
+        self.refresh()
+        if path in self.files:
+            return -errno.ENODATA
+        return self.superself.getxattr(path, name)
+
+
+    def listxattr(self, path):
+        if path == "":
+            return self.superself.listxattr(path)
+
+        self.refresh()
+        if path in self.files:
+            return []
+        return self.superself.listxattr(path)
+
+
+    def write(self, path, buf, offset):
+        self.refresh()
+        f = self.files.get(path)
+        if f is not None:
+            return f.write(buf, offset)
         return self.superself.write(path, buf, offset)
 
 
     def truncate(self, path, length):
-        self.updatefiles()
-        if path in self.files:
-            self.files[path].truncate(length)
+        self.refresh()
+        f = self.files.get(path)
+        if f is not None:
+            f.truncate(length)
             return None
         return self.superself.truncate(path, length)
@@ -1,11 +1,15 @@
 # coding: utf-8
 
 import time
+import errno
 import random
+import urlparse
 import requests
-import threading
-import lxml.html
 
+import pages
+import metrics
+import deadline
+import scheduler as sched
 import fileobjects as fo
 import threadsync as th
 from . import FSSubModuleFiles
@@ -18,6 +22,8 @@ class AuthException(BaseException):
 
 
 class FileUsername(fo.File):
+    __slots__ = ('auth',)
+
     def __init__(self, name, auth, **kwargs):
         kwargs.setdefault('isWritable', True)
         super(FileUsername, self).__init__(name, **kwargs)
@@ -27,7 +33,7 @@ class FileUsername(fo.File):
     def content(self, val):
         fo.File.content.fset(self, val)
         # rstrip only for auth, not for the content of the file.
-        val = val.rstrip("\r\n")
+        val = bytes(val).rstrip("\r\n")
 
         if val != self.auth.username:
             self.auth.deauth()
@@ -36,6 +42,8 @@ class FileUsername(fo.File):
 
 
 class FilePassword(fo.File):
+    __slots__ = ('auth',)
+
     def __init__(self, name, auth, **kwargs):
         kwargs.setdefault('isWritable', True)
         kwargs.setdefault('content', b"<password is write-only>\n")
@@ -64,6 +72,8 @@ class FilePassword(fo.File):
 
 
 class FileDeauth(fo.File):
+    __slots__ = ('auth',)
+
     def __init__(self, name, auth, **kwargs):
         kwargs.setdefault('isWritable', True)
         kwargs.setdefault('content', b"<Write 1 to this file to logout>\n")
@@ -92,8 +102,8 @@ class Auth(FSSubModuleFiles):
     """This class is responsible for the virtual files /username, /password and
     /deauth."""
 
-    def __init__(self, req):
-        super(Auth, self).__init__()
+    def __init__(self, req, *args, **kwargs):
+        super(Auth, self).__init__(*args, **kwargs)
         self.req = req
         self.files = {}
 
@@ -111,13 +121,19 @@ class AuthRequests(object):
 
     urlbase = "https://www.newbiecontest.org/"
     urlauth = "forums/index.php?action=login2"
+    concurrency = 20
+    connecttimeout = 10
+    readtimeout = 30
 
-    def __init__(self):
+    def __init__(self, urlbase = None):
+        if urlbase is not None:
+            self.urlbase = urlbase
         self.username = ''
         self.password = ''
         self.cookies = None
 
-        self.sem = threading.Semaphore(20)
+        self.sem = sched.fetches
+        self.sem.resize(self.concurrency)
         self.cookiesLock = th.RWLock()
         self.authComplete = th.EventTAS()
         self.authSuccess = False
@@ -130,24 +146,67 @@ class AuthRequests(object):
         return self.urlbase + path
 
 
+    def urlkind(self, url):
+        """Name the kind of page for the statistics. The challenge list, the
+        categories and the challenges are told apart."""
+        query = dict(urlparse.parse_qsl(urlparse.urlsplit(url).query))
+        kind = query.get('page', query.get('action'))
+        if kind is None:
+            return "other"
+
+        if kind == 'challenges':
+            if 'action' in query:
+                kind += "." + query['action']
+            elif 'id' in query:
+                kind += ".challenge"
+            elif 'cat' in query:
+                kind += ".category"
+            else:
+                kind += ".list"
+        return kind
+
+
     # Has to be called with self.cookiesLock read-locked at least
     def _request(self, method, url, **kwargs):
         kwargs.setdefault('allow_redirects', True)
         kwargs.setdefault('cookies', self.cookies)
+        kind = "http." + self.urlkind(url)
         url = self.fullurl(url)
 
         for _ in range(3):
-            resp = requests.request(method, url, **kwargs)
+            # Never wait for the server longer than the file operation can
+            timeout = (deadline.cap(self.connecttimeout), deadline.cap(self.readtimeout))
+            try:
+                with metrics.timer(kind):
+                    resp = requests.request(method, url, timeout = timeout, **kwargs)
+            except requests.exceptions.Timeout:
+                metrics.incr("http.timeout")
+                if deadline.expired():
+                    raise deadline.DeadlineExceeded()
+                raise IOError(errno.EIO, "Request timed out")
+            except requests.exceptions.RequestException as e:
+                metrics.incr("http.error")
+                raise IOError(errno.EIO, str(e))
+
             if resp.status_code != 403:
                 break
 
-            # Sleep for 1 to 10 seconds before retrying
-            time.sleep(random.randint(10, 100) / 10)
+            metrics.incr("http.403")
+
+            # Sleep for 1 to 10 seconds before retrying, unless the file
+            # operation would be over by then
+            delay = random.randint(10, 100) / 10
+            left = deadline.remaining()
+            if left is not None and left <= delay:
+                raise deadline.DeadlineExceeded()
+            time.sleep(delay)
         return resp
 
 
     def request(self, method, url, auth = False, **kwargs):
-        with self.sem, self.cookiesLock.read():
+        sem = metrics.waiting("wait.sem", deadline.Bounded(self.sem))
+        lock = metrics.waiting("wait.cookiesLock", deadline.Bounded(self.cookiesLock.reader))
+        with sem, lock:
             resp = self._request(method, url, **kwargs)
 
             if not auth:
@@ -178,7 +237,8 @@ class AuthRequests(object):
                 else:
                     # Someone else is running an authentication, just wait for it...
                     with self.cookiesLock.unlock():
-                        self.authComplete.wait()
+                        if not self.authComplete.wait(deadline.remaining()):
+                            raise deadline.DeadlineExceeded()
 
                 if not self.authSuccess:
                     raise AuthException
@@ -207,17 +267,7 @@ class AuthRequests(object):
 
     @staticmethod
     def is_auth(res):
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        forms = doc.cssselect('div#content > div.member > form')
-        if len(forms) > 0:
-            return False
-
-        infos = doc.cssselect('div#content > div.member > div#memberinfos')
-        if len(infos) > 0:
-            return True
-
-        # I dunno, LOL. ¯\_(ツ)_/¯
-        return False
+        return pages.parser.parse(pages.isauth, res)
 
 
     # Has to be called with self.cookiesLock write-locked
@@ -234,8 +284,9 @@ class AuthRequests(object):
 
 
     def auth(self):
-        with self.cookiesLock.write():
-            self._auth()
+        with sched.priority('auth'), deadline.Bounded(self.sem):
+            with self.cookiesLock.write():
+                self._auth()
 
 
     # Has to be called with self.cookiesLock write-locked
@@ -1,19 +1,26 @@
 # coding: utf-8
 
 import errno
-import copy
 import time
-import datetime
-import re
-import lxml.html
-
+import json
+
+import pages
+import votes
+import search
+import changes
+import scheduler as sched
+import membudget as mb
 import fileobjects as fo
+import htmlconverter as hc
+import deadline
 from authrequests import AuthException
-from . import ParsingException, FSSubModuleFiles
+from . import FSSubModuleFiles, ParsingException
 
 
 
 class UnAuthFile(fo.File):
+    __slots__ = ()
+
     def __init__(self, name, **kwargs):
         kwargs.setdefault('content', b"You are not authenticated !\n")
         super(UnAuthFile, self).__init__(name, **kwargs)
@@ -21,6 +28,8 @@ class UnAuthFile(fo.File):
 
 
 class VoteFile(fo.File):
+    __slots__ = ('chall',)
+
     def __init__(self, name, chall, **kwargs):
         kwargs.setdefault('isWritable', True)
         super(VoteFile, self).__init__(name, **kwargs)
@@ -37,10 +46,8 @@ class VoteFile(fo.File):
             if val != 'nothing':
                 return -errno.EINVAL
 
-        ret = self.chall.send_vote(val)
-        if ret is not None:
-            return ret
-
+        # The vote is sent in background, see the file vote.status
+        votes.queue.submit(self.chall, val)
         self.content = str(val) + "\n"
         return length
 
@@ -52,17 +59,18 @@ class VoteFile(fo.File):
 
 class Challenge(FSSubModuleFiles):
     cachelife = 60
+    contentlife = 6 * 3600
+    maxcontentlife = 7 * 86400
     unauthcachelife = 3
-    namere = re.compile('(.*), par .*')
-    lastvalidre = re.compile('Dernière validation par (.*), le (\d+/\d+/\d+ à \d+:\d+)')
-    validsre = re.compile('(\d+) validation')
-    ptsre = re.compile('(\d+) point')
-    qualityre = re.compile('([0-9.]+) / 10')
 
+    # The files dropped by evict
+    heavyfiles = ["description", "description.html"]
 
-    def __init__(self, req, name, url, status, valids, pts, quality, date):
+
+    def __init__(self, req, path, name, url, status, valids, pts, quality, date):
         super(Challenge, self).__init__()
         self.req = req
+        self.path = path
         self.name = name
         self.url = url
         self.status = status
@@ -72,190 +80,290 @@ class Challenge(FSSubModuleFiles):
         self.date = date
         self.cacheexpir = None
 
+        # The content of the challenge page is cached longer
+        self.pageexpir = None
+        self.pagefiles = {}
+        self.pagesize = 0
+        self.evicted = False
+        self.lastvalidator = None
+        self.votestatus = "none"
 
-    def updatefiles(self):
-        now = time.time()
-        if self.cacheexpir is not None and self.cacheexpir > now:
-            return
 
-        self.files = {}
+    def notify(self, status, valids):
+        """Record the changes of status and validation count in the change
+        feed."""
+        if status != self.status:
+            changes.feed.append("status", self.path, self.status, status)
+        if valids != self.valids:
+            changes.feed.append("validations", self.path, self.valids, valids)
 
-        fullurl = self.req.fullurl(self.url)
-        self.files['url'] = fo.File('url', content = bytes(fullurl + "\n"))
 
-        # Poor man's alternative to the real files gotten below
-        self.files["status"] = fo.File("status", content = bytes(self.status) + "\n")
-        self.files["name"] = fo.File("name", content = bytes(self.name) + "\n")
-        self.files["validations"] = fo.File("validations", content = bytes(self.valids) + "\n")
-        self.files["points"] = fo.File("points", content = bytes(str(self.pts)) + "\n")
+    def updatelisting(self, status, valids, pts, quality, date):
+        """Update the informations given by the challenge list of the
+        category. The files are only updated at the next refresh. The page is
+        downloaded again if the status or the validations changed."""
+        if status != self.status or valids != self.valids:
+            self.pageexpir = None
+            self.notify(status, valids)
 
-        summary = "name: " + self.name + "\n"
-        if self.status == 'devnull':
-            summary += "status: /dev/null\n"
-        elif self.status == 'nonvalid':
-            summary += "status: Not validated\n"
-        elif self.status == 'valid':
-            summary += "status: Validated\n"
-        else:
-            summary += "status: Unknown\n"
+        self.status = status
+        self.valids = valids
+        self.pts = pts
+        self.quality = quality
+        self.date = date
+
+
+    def invalidate(self):
+        self.cacheexpir = None
+        self.pageexpir = None
+        super(Challenge, self).invalidate()
 
-        summary += "creation date: "
-        summary += time.strftime("%Y/%m/%d", time.localtime(self.date))
-        summary += "\n"
-        summary += "challenge url: " + self.req.fullurl(self.url) + "\n"
-        summary += "validation count: " + str(self.valids) + "\n"
-        summary += "quality: " + str(self.quality) + " / 10\n"
-        self.files["summary"] = fo.File("summary", content = bytes(summary))
+
+    def evict(self):
+        """Drop the description of the challenge and the computed files to
+        save memory. The other files are still served from the cache, the page
+        is only downloaded again when one of the dropped files is read."""
+        if not self.updatelock.acquire(False):
+            return False
 
         try:
-            res = self.req.get(self.url, True)
-        except AuthException:
-            self.files['NotAuthenticated'] = UnAuthFile('NotAuthenticated')
-            self.cacheexpir = now + self.unauthcachelife
+            pagefiles = dict(self.pagefiles)
+            for name in self.heavyfiles:
+                if name in pagefiles:
+                    pagefiles[name] = fo.File(name, provider = self.reloader(name))
+
+            files = dict(self.files)
+            files.update(pagefiles)
+            descfile = files.get("description")
+            files["summary"] = fo.File("summary", provider = lambda: self.mksummary(descfile))
+
+            self.pagefiles = pagefiles
+            self.pagesize = 0
+            self.evicted = True
+            self.publish(files = files)
+        finally:
+            self.endupdate()
+
+
+    def reloader(self, name):
+        """Return a provider giving the content of the file name of the page
+        once downloaded again."""
+        def provider():
+            self.reload()
+            f = self.pagefiles.get(name)
+            if f is None:
+                raise IOError(errno.ENOENT, "%s is not on the page anymore" % name)
+            return f.content
+        return provider
+
+
+    def reload(self):
+        """Download the page of an evicted challenge, unless another thread
+        just did it."""
+        if not self.beginupdate(stale = False):
             return
 
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        [content] = doc.cssselect('div#content > div.textpad')
-
-        # Get the status of the challenge
-        [img] = content.cssselect('img[alt="Validation"]')
-        statustitle = img.get('title')
-        if u"supprimée" in statustitle:
-            self.status = 'devnull'
-        elif u"non validée" in statustitle:
-            self.status = 'nonvalid'
-        elif u"validée" in statustitle:
-            self.status = 'valid'
-        else:
-            self.status = 'unknown'
-
-        self.files["status"] = fo.File("status", content = bytes(self.status) + "\n")
-
-        # Parse the challenge name
-        h2 = content.cssselect('h2')
-        self.name = lxml.html.tostring(h2[0], encoding = 'utf-8', method = 'text')
-        self.name = self.name.rstrip("\r\n")
-        match = self.namere.match(self.name)
-        if match is not None:
-            self.name = match.group(1)
-        self.files["name"] = fo.File("name", content = bytes(self.name + "\n"))
-
-        # Parse the author from the "name"
-        links = h2[0].cssselect('a[href *= "page=info_membre"]')
-        if len(links) > 0:
-            self.author = lxml.html.tostring(links[0], encoding = 'utf-8', method = 'text')
-            self.files["author"] = fo.File("author", content = bytes(self.author + "\n"))
-        else:
-            self.author = None
-
-        # Parse number of validations
-        # Note that self.valids is used to make the file "lastvalidation"
-        self.valids = None
-        for valids in content.xpath(u'.//*[contains(text(), "validation")]'):
-            validstxt = lxml.html.tostring(valids, encoding = 'utf-8', method = 'text')
-            match = self.validsre.match(validstxt)
-            if match is not None:
-                self.valids = int(match.group(1))
-                break
-        if self.valids is None:
-            self.valids = 0
-
-        # Parse nickname and date of last validation
-        if not self.status == 'devnull' and self.valids > 0:
-            [lastvalid] = content.xpath(u'.//*[contains(text(), "Dernière validation par")]')
-            lastvalid = lxml.html.tostring(lastvalid, encoding = 'utf-8', method = 'text')
-            match = self.lastvalidre.match(lastvalid)
-            (lastvalidname, lastvaliddate) = match.groups()
-            date = datetime.datetime.strptime(lastvaliddate, "%d/%m/%Y à %H:%M")
-            lastvalidation = fo.File("lastvalidation", content = bytes(lastvalidname + "\n"))
-            lastvalidation.stat.st_mtime = int(date.strftime("%s"))
-            lastvalidation.stat.st_ctime = lastvalidation.stat.st_mtime
-            self.files["lastvalidation"] = lastvalidation
-        else:
-            lastvalidation = None
+        try:
+            if not self.evicted:
+                return
+            self.pageexpir = None
+            self.cacheexpir = None
+            self.updatefiles()
+        except deadline.DeadlineExceeded:
+            raise
+        except (Exception, ParsingException) as e:
+            self.failed(e)
+            raise IOError(errno.EIO, "The page could not be downloaded again")
+        finally:
+            self.endupdate()
+
+
+    def keptfiles(self):
+        # The files from the challenge list are known even if the page could
+        # never be downloaded
+        if len(self.files) == 0:
+            return self.listingfiles()
+        return dict(self.files)
+
+
+    def resident(self):
+        """Estimate the memory used by the page and the computed files."""
+        return self.pagesize + sum(f.resident for f in self.files.values())
+
+
+    def charge(self):
+        """Record the memory used by the page as the most recently used."""
+        if len(self.pagefiles) > 0 and not self.evicted:
+            mb.budget.use(self, self.resident())
+
+
+    def getattr(self, path):
+        # The stat of a file may have computed its content
+        st = super(Challenge, self).getattr(path)
+        self.charge()
+        return st
+
+
+    def updatefiles(self):
+        self.charge()
+
+        now = time.time()
+        if self.cacheexpir is not None and self.cacheexpir > now:
+            return
+
+        # The counters come from the challenge list between two downloads of
+        # the challenge page
+        if self.pageexpir is None or self.pageexpir <= now:
+            try:
+                rec = self.fetchpage()
+            except AuthException:
+                files = self.listingfiles()
+                files['NotAuthenticated'] = UnAuthFile('NotAuthenticated')
+                self.publish(files = files)
+                self.cacheexpir = now + self.unauthcachelife
+                return
+
+            # The page of a /dev/nulled challenge is not supposed to change
+            if self.status == 'devnull':
+                life = self.maxcontentlife
+            else:
+                life = self.nextlife(sorted(rec.items()), self.contentlife, self.maxcontentlife)
+            self.pageexpir = now + life
+
+        files = self.listingfiles()
+        files.update(self.pagefiles)
 
         # Make the "validations" file
         validsfile = fo.File("validations", content = bytes(str(self.valids) + "\n"))
         # Copy the last validation date from lastvalidation if it exists
+        lastvalidation = files.get("lastvalidation")
         if lastvalidation is not None:
             validsfile.stat.st_mtime = lastvalidation.stat.st_mtime
             validsfile.stat.st_ctime = validsfile.stat.st_mtime
-        self.files["validations"] = validsfile
+        files["validations"] = validsfile
 
-        # Parse the number of points
-        if not self.status == 'devnull':
-            # Some challenges are fucky
-            for points in content.xpath(u'.//*[contains(text(), "point")]'):
-                pts = lxml.html.tostring(points, encoding = 'utf-8', method = 'text')
-                match = self.ptsre.match(pts)
-                if match is not None:
-                    self.pts = int(match.group(1))
-            self.files["points"] = fo.File("points", content = bytes(str(self.pts)) + "\n")
-
-        # Parse quality
         if not self.status == 'devnull':
-            [img] = content.cssselect('img[src *= "challs_ranks"]')
-            self.quality = img.get('title')
-            match = self.qualityre.match(self.quality)
-            self.quality = float(match.group(1))
-            self.files["quality"] = fo.File("quality", content = bytes(str(self.quality)) + "\n")
-
-        # Parse help url
-        [link] = content.xpath('.//a[img/@alt="Aide"]')
-        self.helpurl = link.get('href')
-        self.helpurl = self.req.fullurl(self.helpurl)
-        self.files["helpurl"] = fo.File("helpurl", content = bytes(self.helpurl + "\n"))
-
-        # Parse afterwards url (if any)
-        if self.status == 'valid':
-            [link] = content.xpath('.//a[img/@alt="Afterwards"]')
-            self.afterurl = link.get('href')
+            files["points"] = fo.File("points", content = bytes(str(self.pts)) + "\n")
+            files["quality"] = fo.File("quality", content = bytes(str(self.quality)) + "\n")
+
+        # Generate a challenge summary the first time it's read
+        descfile = files.get("description")
+        summary = lambda: self.mksummary(descfile)
+        files["summary"] = fo.File("summary", provider = summary)
+
+        self.publish(files = files)
+        self.cacheexpir = now + self.cachelife
+        self.charge()
+
+
+    def xattrs(self):
+        """The attributes from the challenge list of the category, and those
+        from the page if it's in the cache. The page is never downloaded."""
+        attrs = {
+            "name": self.name,
+            "status": self.status,
+            "validations": self.valids,
+            "points": self.pts,
+            "quality": self.quality,
+            "date": time.strftime("%Y-%m-%d", time.localtime(self.date)),
+            "url": self.req.fullurl(self.url),
+        }
+
+        if len(self.pagefiles) > 0:
+            attrs["author"] = self.author
+            attrs["helpurl"] = self.helpurl
+            attrs["afterwardsurl"] = self.afterurl
+            attrs["lastvalidation"] = self.lastvalidator
+            attrs["vote"] = self.vote
+
+        return dict(("user.nc." + k, bytes(v)) for (k, v) in attrs.items()
+                if v is not None)
+
+
+    def listingfiles(self):
+        """Make the files known from the challenge list of the category."""
+        files = {}
+
+        fullurl = self.req.fullurl(self.url)
+        files['url'] = fo.File('url', content = bytes(fullurl + "\n"))
+
+        files["status"] = fo.File("status", content = bytes(self.status) + "\n")
+        files["name"] = fo.File("name", content = bytes(self.name) + "\n")
+        files["validations"] = fo.File("validations", content = bytes(self.valids) + "\n")
+        files["points"] = fo.File("points", content = bytes(str(self.pts)) + "\n")
+
+        files["summary"] = fo.File("summary", provider = self.mksummary)
+        return files
+
+
+    def fetchpage(self):
+        """Download and parse the challenge page. The files that only depend
+        on it are kept in self.pagefiles. Return the parsed record."""
+
+        res = self.req.get(self.url, True)
+        rec = pages.parser.parse(pages.challenge, res)
+        pagefiles = {}
+
+        self.notify(rec['status'], rec['valids'])
+        search.index.update(self.path, rec['words'])
+        self.status = rec['status']
+        self.name = rec['name']
+        self.valids = rec['valids']
+
+        self.author = rec['author']
+        if self.author is not None:
+            pagefiles["author"] = fo.File("author", content = bytes(self.author + "\n"))
+
+        if rec['lastvalid'] is not None:
+            (lastvalidname, date) = rec['lastvalid']
+            if self.lastvalidator is not None and lastvalidname != self.lastvalidator:
+                changes.feed.append("lastvalidation", self.path, self.lastvalidator, lastvalidname)
+            self.lastvalidator = lastvalidname
+            lastvalidation = fo.File("lastvalidation", content = bytes(lastvalidname + "\n"))
+            lastvalidation.stat.st_mtime = date
+            lastvalidation.stat.st_ctime = lastvalidation.stat.st_mtime
+            pagefiles["lastvalidation"] = lastvalidation
+
+        if rec['pts'] is not None:
+            self.pts = rec['pts']
+        if rec['quality'] is not None:
+            self.quality = rec['quality']
+
+        self.helpurl = self.req.fullurl(rec['helpurl'])
+        pagefiles["helpurl"] = fo.File("helpurl", content = bytes(self.helpurl + "\n"))
+
+        self.afterurl = rec['afterurl']
+        if self.afterurl is not None:
             self.afterurl = self.req.fullurl(self.afterurl)
-            self.files["afterwardsurl"] = fo.File("afterwardsurl", content = bytes(self.afterurl + "\n"))
-        else:
-            self.afterurl = None
-
-        # Parse the challenge description
-        content2 = copy.deepcopy(content)
-        # Remove everything up to (and including) the first <h2> element
-        while len(content2) > 0 and content2[0].tag != 'h2':
-            content2.remove(content2[0])
-        if len(content2) > 0 and content2[0].tag == 'h2':
-            content2.remove(content2[0])
-        # Remove the end up to the second last <hr> if the challenged is not /dev/nulled
-        if self.status != 'devnull':
-            for _ in range(2):
-                while len(content2) > 0 and content2[-1].tag != 'hr':
-                    content2.remove(content2[-1])
-                if len(content2) > 0 and content2[-1].tag == 'hr':
-                    content2.remove(content2[-1])
-
-        # Put the full HTML of the challenge in a file
-        self.deschtml = lxml.html.tostring(content2)
-        self.files["description.html"] = fo.File("description.html", content = bytes(self.deschtml + "\n"))
-
-        content2.make_links_absolute()
-        try:
-            import html2text
-            htmlcontent = lxml.html.tostring(content2, method = 'html')
-            self.desc = html2text.html2text(htmlcontent).encode('utf-8')
-        except ImportError:
-            self.desc = lxml.html.tostring(content2, encoding = 'utf-8', method = 'text')
-
-        self.files["description"] = fo.File("description", content = bytes(self.desc + "\n"))
-
-        # Parse the vote
-        if self.status == 'valid':
-            [form] = content.cssselect('form[name *= "polling"]')
-            self.voteurl = form.get('action')
-            [option] = form.cssselect('option[selected]')
-            self.vote = option.get('value')
-            self.files["vote"] = VoteFile("vote", self, content = bytes(self.vote + "\n"))
-
-        # Generate a challenge summary
+            pagefiles["afterwardsurl"] = fo.File("afterwardsurl", content = bytes(self.afterurl + "\n"))
+
+        # Put the full HTML of the challenge in a file, rendered only when read
+        deschtml = rec['deschtml']
+        desclinks = rec['desclinks']
+        self.pagesize = len(deschtml) + len(desclinks)
+        pagefiles["description.html"] = fo.File("description.html", provider = lambda: deschtml + "\n")
+        desc = lambda: hc.converter.convert(desclinks) + "\n"
+        pagefiles["description"] = fo.File("description", provider = desc)
+
+        self.voteurl = rec['voteurl']
+        self.vote = rec['vote']
+        if self.vote is not None:
+            pagefiles["vote"] = VoteFile("vote", self, content = bytes(self.vote + "\n"))
+            votestatus = lambda: bytes(self.votestatus) + "\n"
+            pagefiles["vote.status"] = fo.DynamicFile("vote.status", votestatus)
+
+        self.pagefiles = pagefiles
+        self.evicted = False
+        return rec
+
+
+    def mksummary(self, descfile = None):
+        """Generate a challenge summary. Only the informations from the
+        challenge list are used unless the description file is given."""
+
         summary = "name: " + self.name + "\n"
 
-        if self.author is not None:
+        if descfile is not None and self.author is not None:
             summary += "author: " + self.author + "\n"
 
         if self.status == 'devnull':
@@ -271,18 +379,17 @@ class Challenge(FSSubModuleFiles):
         summary += time.strftime("%Y/%m/%d", time.localtime(self.date))
         summary += "\n"
         summary += "challenge url: " + self.req.fullurl(self.url) + "\n"
-        summary += "help url: " + self.helpurl + "\n"
-        if self.afterurl is not None:
-            summary += "afterwards url: " + self.afterurl + "\n"
+        if descfile is not None:
+            summary += "help url: " + self.helpurl + "\n"
+            if self.afterurl is not None:
+                summary += "afterwards url: " + self.afterurl + "\n"
         summary += "validation count: " + str(self.valids) + "\n"
         summary += "quality: " + str(self.quality) + " / 10\n"
-        if self.vote != 'nothing':
-            summary += "vote: " + str(self.vote) + " / 10\n"
-        summary += "content:\n" + self.desc + "\n"
-        self.files["summary"] = fo.File("summary", content = bytes(summary))
-
-
-        self.cacheexpir = now + self.cachelife
+        if descfile is not None:
+            if self.vote is not None and self.vote != 'nothing':
+                summary += "vote: " + str(self.vote) + " / 10\n"
+            summary += "content:\n" + descfile.content
+        return bytes(summary)
 
 
     def getndirs(self):
@@ -291,11 +398,9 @@ class Challenge(FSSubModuleFiles):
 
     def send_vote(self, vote):
         vote = str(vote)
-        res = self.req.post(self.voteurl, data = {'note': vote})
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        [content] = doc.cssselect('div#content > div.textpad')
-        [h2] = content.cssselect('h2')
-        msg = lxml.html.tostring(h2, encoding = 'utf-8', method = 'text')
+        with sched.priority('vote'):
+            res = self.req.post(self.voteurl, data = {'note': vote})
+        msg = pages.parser.parse(pages.vote, res)
         msg = msg.strip().lower()
         if msg.startswith("merci"):
             return None
@@ -308,80 +413,60 @@ class Challenge(FSSubModuleFiles):
 
 class Category(FSSubModuleFiles):
     cachelife = 60
-    validsre = re.compile('^doGraph\((\d+),')
-    ptsre = re.compile('^(\d+) point')
-    votere = re.compile('^([0-9.]+) / 10')
 
 
-    def __init__(self, req, url, nchalls):
+    def __init__(self, req, name, url, nchalls):
         super(Category, self).__init__()
         self.req = req
+        self.name = name
         self.url = url
         self.nchalls = nchalls
         self.cacheexpir = None
 
 
+    def invalidate(self):
+        self.cacheexpir = None
+        super(Category, self).invalidate()
+
+
     def updatefiles(self):
         now = time.time()
         if self.cacheexpir is not None and self.cacheexpir > now:
             return
 
         res = self.req.get(self.url)
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        tables = doc.cssselect('div#content > div.textpad > table')
-
-        # There might be table before the right one for the newest challenges
-        table = tables[-1]
-
-        self.dirmodules = {}
-
-        for row in table.cssselect('tr'):
-            # The first row only contains the column headers
-            if len(row.cssselect('th')) > 0:
-                continue
-
-            [tdlink, tdvalids, tdpts, tdvote, tddate] = row.cssselect('td')
-
-            # Parse link and challenge name
-            [link] = tdlink.cssselect('a')
-            challname = lxml.html.tostring(link, encoding = 'utf-8', method = 'text')
-            challname = challname.replace('/', '_')
-            challurl = link.get('href')
-
-            # Parse validation status (validated, not validated, devnull)
-            [img] = tdvalids.cssselect('img')
-            statusimg = img.get('src')
-            status = 'unknown'
-            if 'nullvalide' in statusimg:
-                status = 'devnull'
-            elif 'nonvalide' in statusimg:
-                status = 'nonvalid'
-            elif 'valide' in statusimg:
-                status = 'valid'
-
-            # Parse validations
-            [script] = tdvalids.cssselect('script')
-            match = self.validsre.match(script.text)
-            validscnt = int(match.group(1))
-
-            # Parse points
-            match = self.ptsre.match(tdpts.text)
-            points = int(match.group(1))
-
-            # Parse votes
-            [img] = tdvote.cssselect('img')
-            match = self.votere.match(img.get('title'))
-            votes = float(match.group(1))
-
-            # Parse date
-            date = time.strptime(tddate.text, "%d/%m/%Y")
-            date = time.mktime(date)
-
-            self.dirmodules[challname] = Challenge(self.req, challname,
-                    challurl, status, validscnt, points, votes, date)
-
-        self.nchalls = len(self.dirmodules)
-        self.cacheexpir = now + self.cachelife
+        rows = pages.parser.parse(pages.category, res)
+        dirmodules = {}
+
+        for (challname, challurl, status, validscnt, points, quality, date) in rows:
+            # Keep the cache of the challenges already known
+            chall = self.dirmodules.get(challname)
+            if chall is not None and chall.url == challurl:
+                chall.updatelisting(status, validscnt, points, quality, date)
+            else:
+                path = self.name + "/" + challname
+                chall = Challenge(self.req, path, challname, challurl, status,
+                        validscnt, points, quality, date)
+
+                # Everything would be new the first time the list is downloaded
+                if len(self.dirmodules) > 0:
+                    changes.feed.append("new", path, "", status)
+
+                # Make the challenge findable by its name until its page is
+                # parsed
+                search.index.add(path, pages.words(challname))
+            dirmodules[challname] = chall
+
+        # Forget the challenges that disappeared, even from a saved index
+        paths = set(chall.path for chall in dirmodules.values())
+        search.index.prune(self.name + "/", paths)
+        for (challname, chall) in self.dirmodules.items():
+            if dirmodules.get(challname) is not chall:
+                mb.budget.forget(chall)
+
+        self.publish(dirmodules = dirmodules)
+        self.nchalls = len(dirmodules)
+        self.cacheexpir = now + self.nextlife(rows, self.cachelife, self.maxlife)
 
 
     def getndirs(self):
@@ -392,13 +477,22 @@ class Category(FSSubModuleFiles):
 class Challenges(FSSubModuleFiles):
     urlcat = "index.php?page=challenges"
     cachelife = 60
-    nchallsre = re.compile('^\d+ / (\d+)')
+    indexfields = ['name', 'category', 'url', 'status', 'validations',
+            'points', 'quality', 'date']
 
 
     def __init__(self, req):
         super(Challenges, self).__init__()
         self.req = req
         self.catexpir = None
+        self.changesfile = changes.ChangesFile(".changes", changes.feed)
+        self.followfile = changes.ChangesFile(".changes.follow", changes.feed, follow = True)
+        self.indexcache = {}
+
+
+    def invalidate(self):
+        self.catexpir = None
+        super(Challenges, self).invalidate()
 
 
     def updatefiles(self):
@@ -407,34 +501,72 @@ class Challenges(FSSubModuleFiles):
             return
 
         res = self.req.get(self.urlcat)
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        tables = doc.cssselect('div#content > div.textpad > table')
-
-        if len(tables) != 3:
-            raise ParsingException()
-
-        self.dirmodules = {}
-
-        # Categories are linked in the first table
-        tablecat = tables[0]
-
-        for row in tablecat.cssselect('tr'):
-            [tdlink, tdcount] = row.cssselect('td')
-
-            # Parse the link and category name
-            [link] = tdlink.cssselect('strong a')
-            caturl = link.get('href')
-            catname = lxml.html.tostring(link, encoding = 'utf-8', method = 'text').strip()
-
-            if catname.startswith('Épreuves '):
-                catname = catname[len('Épreuves '):]
-
-            # Parse the challenge count
-            nchalls = lxml.html.tostring(tdcount, encoding = 'utf-8', method = 'text')
-            match = self.nchallsre.match(nchalls)
-            nchalls = int(match.group(1))
-
-
-            self.dirmodules[catname] = Category(self.req, caturl, nchalls)
-
-        self.catexpir = now + self.cachelife
+        rows = pages.parser.parse(pages.categories, res)
+        dirmodules = {}
+
+        for (catname, caturl, nchalls) in rows:
+            # Keep the cache of the categories already known
+            cat = self.dirmodules.get(catname)
+            if cat is None or cat.url != caturl:
+                cat = Category(self.req, catname, caturl, nchalls)
+            dirmodules[catname] = cat
+
+        # The indexes are generated when read from the challenge lists, and
+        # again when they change
+        files = {}
+        tsv = lambda: self.index(self.indextsv)
+        files["index.tsv"] = fo.DynamicFile("index.tsv", provider = tsv)
+        js = lambda: self.index(self.indexjson)
+        files["index.json"] = fo.DynamicFile("index.json", provider = js)
+        files[".changes"] = self.changesfile
+        files[".changes.follow"] = self.followfile
+
+        self.publish(files = files, dirmodules = dirmodules)
+        self.catexpir = now + self.nextlife(rows, self.cachelife, self.maxlife)
+
+
+    def index(self, gen):
+        """Return the content generated by gen, or the one generated last
+        time if no category changed since."""
+        cats = sorted(self.dirmodules.items())
+        for (_, cat) in cats:
+            cat.refresh()
+
+        key = tuple((catname, cat, cat.version) for (catname, cat) in cats)
+        cached = self.indexcache.get(gen.__name__)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        content = b"".join(gen())
+        self.indexcache[gen.__name__] = (key, content)
+        return content
+
+
+    def indexrows(self):
+        """Generate a tuple per challenge with the fields indexfields. Only the
+        challenge lists of the categories are used, not the challenge pages."""
+        for (catname, cat) in sorted(self.dirmodules.items()):
+            cat.refresh()
+            for (_, chall) in sorted(cat.dirmodules.items()):
+                date = time.strftime("%Y-%m-%d", time.localtime(chall.date))
+                yield (chall.name, catname, self.req.fullurl(chall.url),
+                        chall.status, chall.valids, chall.pts, chall.quality,
+                        date)
+
+
+    def indextsv(self):
+        yield "\t".join(self.indexfields) + "\n"
+        for row in self.indexrows():
+            row = (str(v).replace("\t", " ").replace("\n", " ") for v in row)
+            yield "\t".join(row) + "\n"
+
+
+    def indexjson(self):
+        sep = "[\n"
+        for row in self.indexrows():
+            yield sep + json.dumps(dict(zip(self.indexfields, row)), sort_keys = True)
+            sep = ",\n"
+
+        if sep == "[\n":
+            yield "["
+        yield "\n]\n"
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+import fuse
+import time
+import errno
+import threading
+
+import deadline
+import fileobjects as fo
+
+
+
+class ChangeFeed(object):
+    """An append-only log of the changes noticed on the challenges when their
+    lists and pages are downloaded again. One line per change with the
+    fields date, kind, path, old value and new value separated by tabs.
+
+    Only the last maxsize bytes are kept, but the offsets keep counting from
+    the first change so that a reader can continue where it stopped."""
+
+    maxsize = 2**20
+
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.data = bytearray()
+        self.base = 0
+        self.mtime = int(time.time())
+
+
+    def append(self, kind, path, old, new):
+        now = time.time()
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        fields = (date, kind, path, old, new)
+        fields = (str(v).replace("\t", " ").replace("\n", " ") for v in fields)
+        line = "\t".join(fields) + "\n"
+
+        with self.cond:
+            self.data.extend(line)
+            if len(self.data) > self.maxsize:
+                # Drop whole lines
+                drop = self.data.find(b"\n", len(self.data) - self.maxsize) + 1
+                del self.data[:drop]
+                self.base += drop
+            self.mtime = int(now)
+            self.cond.notify_all()
+
+
+    def size(self):
+        with self.cond:
+            return self.base + len(self.data)
+
+
+    def read(self, size, offset, wait = 0):
+        """Read from offset. If there is nothing to read, wait at most wait
+        seconds for new changes before returning an end of file."""
+        with self.cond:
+            if wait > 0 and size > 0:
+                end = time.time() + wait
+                while offset >= self.base + len(self.data):
+                    left = end - time.time()
+                    if left <= 0:
+                        break
+                    self.cond.wait(left)
+
+            start = max(offset - self.base, 0)
+            return bytes(self.data[start:start+size])
+
+
+
+class ChangesFile(fo.File):
+    """A read-only view of a ChangeFeed. Its size is the size of the feed at
+    the time of the stat. Reading at the end of a following file blocks until
+    new changes arrive, like tail -f, but at most followwait seconds or until
+    the deadline of the operation. A following file is not listed so that a
+    recursive grep doesn't get stuck on it."""
+
+    __slots__ = ('feed', 'follow')
+
+    followwait = 60
+
+    def __init__(self, name, feed, follow = False, **kwargs):
+        super(ChangesFile, self).__init__(name, **kwargs)
+        self.feed = feed
+        self.follow = follow
+
+    @property
+    def stat(self):
+        self._stat.st_size = self.feed.size()
+        self._stat.st_mtime = self.feed.mtime
+        self._stat.st_ctime = self.feed.mtime
+        return self._stat
+
+    @property
+    def resident(self):
+        return 0
+
+    @property
+    def listed(self):
+        return not self.follow
+
+    def open(self, flags):
+        # Let every read through, the size changes behind the kernel's back
+        return fuse.FuseFileInfo(direct_io = True)
+
+    def read(self, size, offset):
+        wait = 0
+        if self.follow:
+            wait = self.followwait
+            left = deadline.remaining()
+            if left is not None:
+                wait = min(wait, left)
+        return self.feed.read(size, offset, wait)
+
+    def write(self, buf, offset):
+        return -errno.EACCES
+
+    def truncate(self, size):
+        return -errno.EACCES
+
+
+
+feed = ChangeFeed()
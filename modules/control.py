@@ -0,0 +1,236 @@
+# coding: utf-8
+
+import os
+import errno
+
+import profiler
+import deadline
+import membudget as mb
+import fileobjects as fo
+import news
+import challenges
+import authrequests
+from . import FSSubModuleFiles
+
+
+
+# The settings that can be changed with a mount option or a file in /.control
+settingshelp = [
+    ("challengelife", "float", "SECS", "cache the challenge counters for SECS"),
+    ("contentlife", "float", "SECS", "cache the challenge pages for SECS"),
+    ("unauthlife", "float", "SECS", "retry the authentication after SECS"),
+    ("categorylife", "float", "SECS", "cache the challenge lists for SECS"),
+    ("challengeslife", "float", "SECS", "cache the category list for SECS"),
+    ("newslife", "float", "SECS", "cache the news for SECS"),
+    ("maxlife", "float", "SECS", "cache the lists that don't change for up to SECS"),
+    ("maxcontentlife", "float", "SECS", "cache the pages that don't change for up to SECS"),
+    ("concurrency", "int", "N", "make at most N requests at a time"),
+    ("connecttimeout", "float", "SECS", "give up connecting to the site after SECS"),
+    ("readtimeout", "float", "SECS", "give up a request stalled for SECS"),
+    ("deadline", "float", "SECS", "give up the network after SECS in a file operation"),
+    ("membudget", "int", "MB", "keep at most MB megabytes of challenge pages"),
+    ("failbackoff", "float", "SECS", "retry a failed update after SECS, twice longer at each failure"),
+]
+
+
+def settings(req):
+    """Return a dict associating the name of each setting with a tuple of
+    functions to get it, set it and convert a string to its type."""
+
+    def classattr(cls, attr):
+        return (lambda: getattr(cls, attr), lambda v: setattr(cls, attr, v), float)
+
+    def limit(convert):
+        """Convert a limit, 0 and "unlimited" giving None for no limit."""
+        def conv(s):
+            if s.strip() == "unlimited":
+                return None
+            return convert(s) or None
+        return conv
+
+    def setconcurrency(val):
+        authrequests.AuthRequests.concurrency = val
+        req.sem.resize(val)
+
+    def getdeadline():
+        if deadline.limit is None:
+            return "unlimited"
+        return deadline.limit
+
+    def setdeadline(val):
+        deadline.limit = val or None
+
+    def getmembudget():
+        if mb.budget.budget is None:
+            return "unlimited"
+        return mb.budget.budget // 2**20
+
+    def setmembudget(val):
+        mb.budget.setbudget(val * 2**20 if val else None)
+
+    return {
+        "challengelife": classattr(challenges.Challenge, 'cachelife'),
+        "contentlife": classattr(challenges.Challenge, 'contentlife'),
+        "unauthlife": classattr(challenges.Challenge, 'unauthcachelife'),
+        "categorylife": classattr(challenges.Category, 'cachelife'),
+        "challengeslife": classattr(challenges.Challenges, 'cachelife'),
+        "newslife": classattr(news.News, 'newslife'),
+        "maxlife": classattr(FSSubModuleFiles, 'maxlife'),
+        "maxcontentlife": classattr(challenges.Challenge, 'maxcontentlife'),
+        "concurrency": (lambda: req.sem.size, setconcurrency, int),
+        "connecttimeout": classattr(authrequests.AuthRequests, 'connecttimeout'),
+        "readtimeout": classattr(authrequests.AuthRequests, 'readtimeout'),
+        "deadline": (getdeadline, setdeadline, limit(float)),
+        "membudget": (getmembudget, setmembudget, limit(int)),
+        "failbackoff": classattr(FSSubModuleFiles, 'failbackoff'),
+    }
+
+
+
+class FileSetting(fo.DynamicFile):
+    """Reading gives the value of a setting, writing a positive number changes
+    it immediately. The limits can also be removed by writing 0 or
+    unlimited."""
+
+    __slots__ = ('setter', 'convert')
+
+    def __init__(self, name, getter, setter, convert, **kwargs):
+        kwargs.setdefault('isWritable', True)
+        provider = lambda: bytes(getter()) + "\n"
+        super(FileSetting, self).__init__(name, provider, **kwargs)
+        self.setter = setter
+        self.convert = convert
+
+    def write(self, buf, offset):
+        try:
+            val = self.convert(buf)
+        except ValueError:
+            return -errno.EINVAL
+
+        if val is not None and val <= 0:
+            return -errno.EINVAL
+        self.setter(val)
+        return len(buf)
+
+    def truncate(self, size):
+        return
+
+
+
+class FileInvalidate(fo.File):
+    """Writing the path of a directory expires the caches of everything below
+    it."""
+
+    __slots__ = ('root',)
+
+    def __init__(self, name, root, **kwargs):
+        kwargs.setdefault('isWritable', True)
+        kwargs.setdefault('content', b"<Write a path to expire its cache>\n")
+        super(FileInvalidate, self).__init__(name, **kwargs)
+        self.root = root
+
+    def write(self, buf, offset):
+        path = buf.strip().strip("/")
+        m = self.root.submodule(path)
+        if m is None:
+            return -errno.ENOENT
+        m.invalidate()
+        return len(buf)
+
+    def truncate(self, size):
+        return
+
+
+
+class FileWarm(fo.DynamicFile):
+    """Writing a non-zero number starts a crawl, reading gives its progress."""
+
+    __slots__ = ('crawler',)
+
+    def __init__(self, name, crawler, **kwargs):
+        kwargs.setdefault('isWritable', True)
+        super(FileWarm, self).__init__(name, crawler.status, **kwargs)
+        self.crawler = crawler
+
+    def write(self, buf, offset):
+        try:
+            if int(buf):
+                self.crawler.start()
+        except ValueError:
+            pass
+        return len(buf)
+
+    def truncate(self, size):
+        return
+
+
+
+class FileExport(fo.DynamicFile):
+    """Writing an absolute path starts an export of the tree to a snapshot
+    file, reading gives its progress."""
+
+    __slots__ = ('exporter',)
+
+    def __init__(self, name, exporter, **kwargs):
+        kwargs.setdefault('isWritable', True)
+        super(FileExport, self).__init__(name, exporter.status, **kwargs)
+        self.exporter = exporter
+
+    def write(self, buf, offset):
+        path = buf.strip()
+        if not os.path.isabs(path):
+            return -errno.EINVAL
+        if not self.exporter.start(path):
+            return -errno.EBUSY
+        return len(buf)
+
+    def truncate(self, size):
+        return
+
+
+
+class FileProfile(fo.DynamicFile):
+    """Writing a number of seconds samples the stacks of all the threads for
+    that long, reading gives the collapsed stacks."""
+
+    __slots__ = ()
+
+    def __init__(self, name, **kwargs):
+        kwargs.setdefault('isWritable', True)
+        super(FileProfile, self).__init__(name, profiler.profiler.status, **kwargs)
+
+    def write(self, buf, offset):
+        try:
+            duration = float(buf)
+        except ValueError:
+            return -errno.EINVAL
+
+        if duration <= 0:
+            return -errno.EINVAL
+        if not profiler.profiler.start(duration):
+            return -errno.EBUSY
+        return len(buf)
+
+    def truncate(self, size):
+        return
+
+
+
+class Control(FSSubModuleFiles):
+    """This class is responsible for the virtual directory /.control."""
+
+    def __init__(self, crawler, exporter, req, root, *args, **kwargs):
+        super(Control, self).__init__(*args, **kwargs)
+        self.crawler = crawler
+        self.exporter = exporter
+
+        wf = FileWarm("warm", crawler)
+        ef = FileExport("export", exporter)
+        pf = FileProfile("profile")
+        inf = FileInvalidate("invalidate", root)
+        self.files = {}
+        for f in [wf, ef, pf, inf]:
+            self.files[f.name] = f
+
+        for (name, (getter, setter, convert)) in settings(req).items():
+            self.files[name] = FileSetting(name, getter, setter, convert)
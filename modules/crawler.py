@@ -0,0 +1,112 @@
+# coding: utf-8
+
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+
+import scheduler as sched
+from authrequests import AuthException
+from . import ParsingException
+
+
+
+class Crawler(object):
+    """Walk the categories and then the challenges with a pool of threads to
+    fill their caches. Only one crawl can run at a time."""
+
+    def __init__(self, challenges, nthreads = 8):
+        self.challenges = challenges
+        self.nthreads = nthreads
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.state = 'idle'
+        self.done = {'categories': 0, 'challenges': 0}
+        self.total = {'categories': 0, 'challenges': 0}
+        self.errors = 0
+        self.starttime = None
+        self.endtime = None
+
+
+    def start(self):
+        """Start a crawl in background. Return False if one is running."""
+        with self.lock:
+            if self.state == 'running':
+                return False
+
+            self.state = 'running'
+            self.done = {'categories': 0, 'challenges': 0}
+            self.total = {'categories': 0, 'challenges': 0}
+            self.errors = 0
+            self.starttime = time.time()
+            self.endtime = None
+
+        self.thread = threading.Thread(target = self.run, name = "crawler")
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+
+    def visit(self, kind, module):
+        try:
+            with sched.priority('prefetch'):
+                module.refresh()
+            if module.failures > 0:
+                with self.lock:
+                    self.errors += 1
+
+            # Also compute the files generated when read
+            for f in module.files.values():
+                f.materialize()
+            module.charge()
+        except (Exception, ParsingException, AuthException):
+            with self.lock:
+                self.errors += 1
+
+        with self.lock:
+            self.done[kind] += 1
+
+
+    def crawl(self, pool, kind, modules):
+        with self.lock:
+            self.total[kind] = len(modules)
+        visit = lambda m: self.visit(kind, m)
+        for _ in pool.imap_unordered(visit, modules):
+            pass
+
+
+    def run(self):
+        pool = ThreadPool(self.nthreads)
+        try:
+            with sched.priority('prefetch'):
+                self.challenges.refresh()
+            categories = self.challenges.dirmodules.values()
+            self.crawl(pool, 'categories', categories)
+
+            challs = []
+            for cat in categories:
+                challs.extend(cat.dirmodules.values())
+            self.crawl(pool, 'challenges', challs)
+
+            state = 'done'
+        except (Exception, ParsingException, AuthException):
+            state = 'failed'
+        finally:
+            pool.close()
+
+        with self.lock:
+            self.state = state
+            self.endtime = time.time()
+
+
+    def status(self):
+        with self.lock:
+            end = self.endtime if self.endtime is not None else time.time()
+            elapsed = end - self.starttime if self.starttime is not None else 0
+
+            status = "state: %s\n" % self.state
+            for kind in ['categories', 'challenges']:
+                status += "%s: %d / %d\n" % (kind, self.done[kind], self.total[kind])
+            status += "errors: %d\n" % self.errors
+            status += "time: %.1fs\n" % elapsed
+            return bytes(status)
@@ -4,9 +4,10 @@ import os
 import time
 import datetime
 import re
-import lxml.html
 
+import pages
 import fileobjects as fo
+import htmlconverter as hc
 from . import ParsingException, FSSubModuleFiles
 
 
@@ -14,7 +15,14 @@ from . import ParsingException, FSSubModuleFiles
 class News(FSSubModuleFiles):
     urlnews = "index.php?page=news"
     newslife = 60
-    datere = re.compile('^(\d+ \d+ \d+ à \d+:\d+:\d+)')
+    monthdict = {
+            "Janvier" : 1, "Février" : 2, "Mars" : 3,
+            "Avril" : 4, "Mai" : 5, "Juin" : 6, "Juillet" : 7,
+            "Août" : 8, "Septembre" : 9, "Octobre" : 10,
+            "Novembre" : 11, "Décembre" : 12
+    }
+    datere = re.compile("^(?:(Aujourd'hui|Hier)|(\d+) (" + "|".join(monthdict) +
+            ") (\d+)) à (\d+):(\d+):(\d+)")
 
 
     def __init__(self, req):
@@ -22,6 +30,31 @@ class News(FSSubModuleFiles):
         self.req = req
         self.newsexpir = None
 
+        # Associate a news title with its content, date and File
+        self.entries = {}
+
+
+    def invalidate(self):
+        self.newsexpir = None
+        super(News, self).invalidate()
+
+
+    def parsedate(self, date, today):
+        match = self.datere.match(date)
+        if match is None:
+            raise ParsingException()
+
+        (relday, day, month, year, h, m, s) = match.groups()
+        if relday is None:
+            day = datetime.date(int(year), self.monthdict[month], int(day))
+        elif relday == 'Hier':
+            day = today - datetime.timedelta(days = 1)
+        else:
+            day = today
+
+        date = datetime.datetime.combine(day, datetime.time(int(h), int(m), int(s)))
+        return int(date.strftime("%s"))
+
 
     def updatefiles(self):
         now = time.time()
@@ -29,62 +62,31 @@ class News(FSSubModuleFiles):
             return
 
         res = self.req.get(self.urlnews)
-        doc = lxml.html.fromstring(res.content, base_url = res.url)
-        elements = doc.cssselect('div#content > div.textpad > *')
-
-        monthdict = {
-                "Janvier" : "01", "Février" : "02", "Mars" : "03",
-                "Avril" : "04", "Mai" : "05", "Juin" : "06", "Juillet" : "07",
-                "Août" : "08", "Septembre" : "09", "Octobre" : "10",
-                "Novembre" : "11", "Décembre" : "12"
-        }
-        self.files = {}
-
-        for i in range(0, len(elements), 4):
-            # The list end with a single <p>
-            if i + 4 > len(elements):
-                break
-
-            [title, content, foot, hr] = elements[i:i+4]
-            if title.tag != 'h2' or hr.tag != 'hr':
-                raise ParsingException()
-
-            # Build a File object
-            titletext = title.text
-            titletext = titletext.strip().replace('/', '_')
-            news = fo.File(titletext)
-
-            # Try to render the html
-            try:
-                import html2text
-                htmlcontent = lxml.html.tostring(content, method = 'html')
-                news.content = html2text.html2text(htmlcontent).encode('utf-8')
-            except ImportError:
-                news.content = lxml.html.tostring(content, encoding = 'utf-8', method = 'text')
-
-
-            # Parse the publish date of the news and set it as the File's stat
-            date = lxml.html.tostring(foot, encoding = 'utf-8', method = 'text')
-            for a, n in monthdict.items():
-                date = date.replace(a, n)
-
-            # Replace "Aujourd'hui" and "Hier" with the date
-            if date.startswith("Aujourd'hui"):
-                today = datetime.date.today()
-                date = date.replace("Aujourd'hui", today.strftime("%d %m %Y"))
-            if date.startswith('Hier'):
-                ystdy = datetime.date.today() - datetime.timedelta(days = 1)
-                date = date.replace('Hier', ystdy.strftime("%d %m %Y"))
-
-            match = self.datere.match(date)
-            if match is None:
-                raise ParsingException()
-
-            date = match.group(1)
-            date = datetime.datetime.strptime(date, "%d %m %Y à %H:%M:%S")
-            news.stat.st_mtime = int(date.strftime("%s"))
-            news.stat.st_ctime = news.stat.st_mtime
+        rows = pages.parser.parse(pages.news, res)
+
+        today = datetime.date.today()
+        entries = {}
+        files = {}
+
+        for (titletext, htmlcontent, foot) in rows:
+            # Parse the publish date of the news
+            date = self.parsedate(foot, today)
+
+            # Keep the File of a news that didn't change
+            old = self.entries.get(titletext)
+            if old is not None and old[:2] == (htmlcontent, date):
+                news = old[2]
+
+            else:
+                # Build a File object and render the html
+                news = fo.File(titletext, content = hc.converter.convert(htmlcontent))
+                news.stat.st_mtime = date
+                news.stat.st_ctime = news.stat.st_mtime
 
             # Add the File to the list
-            self.files[news.name] = news
-        self.newsexpir = now + self.newslife
+            entries[titletext] = (htmlcontent, date, news)
+            files[news.name] = news
+
+        self.entries = entries
+        self.publish(files = files)
+        self.newsexpir = now + self.nextlife(rows, self.newslife, self.maxlife)
@@ -0,0 +1,350 @@
+# coding: utf-8
+
+import re
+import time
+import copy
+import datetime
+import multiprocessing
+import lxml.html
+
+import metrics
+import deadline
+from . import ParsingException
+
+
+
+# The extraction functions only take the raw page and its url and return plain
+# picklable records. They have to be module-level functions to be run by the
+# process pool.
+
+def text(element):
+    return lxml.html.tostring(element, encoding = 'utf-8', method = 'text')
+
+
+
+wordre = re.compile('\w\w+', re.UNICODE)
+
+def words(s):
+    """Return the sorted list of the distinct words of the UTF-8 string s,
+    lowercased, as used by the search index."""
+    found = wordre.findall(s.decode('utf-8', 'replace').lower())
+    return sorted(set(w.encode('utf-8') for w in found))
+
+
+
+def isauth(content, url):
+    doc = lxml.html.fromstring(content, base_url = url)
+    forms = doc.cssselect('div#content > div.member > form')
+    if len(forms) > 0:
+        return False
+
+    infos = doc.cssselect('div#content > div.member > div#memberinfos')
+    if len(infos) > 0:
+        return True
+
+    # I dunno, LOL. ¯\_(ツ)_/¯
+    return False
+
+
+
+challnamere = re.compile('(.*), par .*')
+challlastvalidre = re.compile('Dernière validation par (.*), le (\d+/\d+/\d+ à \d+:\d+)')
+challvalidsre = re.compile('(\d+) validation')
+challptsre = re.compile('(\d+) point')
+challqualityre = re.compile('([0-9.]+) / 10')
+
+def challenge(content, url):
+    """Extract the fields of a challenge page. The description is returned as
+    HTML, once as is and once with absolute links."""
+
+    doc = lxml.html.fromstring(content, base_url = url)
+    [content] = doc.cssselect('div#content > div.textpad')
+    rec = {}
+
+    # Get the status of the challenge
+    [img] = content.cssselect('img[alt="Validation"]')
+    statustitle = img.get('title')
+    if u"supprimée" in statustitle:
+        rec['status'] = 'devnull'
+    elif u"non validée" in statustitle:
+        rec['status'] = 'nonvalid'
+    elif u"validée" in statustitle:
+        rec['status'] = 'valid'
+    else:
+        rec['status'] = 'unknown'
+    devnull = rec['status'] == 'devnull'
+
+    # Parse the challenge name
+    h2 = content.cssselect('h2')
+    name = text(h2[0]).rstrip("\r\n")
+    match = challnamere.match(name)
+    if match is not None:
+        name = match.group(1)
+    rec['name'] = name
+
+    # Parse the author from the "name"
+    links = h2[0].cssselect('a[href *= "page=info_membre"]')
+    rec['author'] = text(links[0]) if len(links) > 0 else None
+
+    # Parse number of validations
+    rec['valids'] = 0
+    for valids in content.xpath(u'.//*[contains(text(), "validation")]'):
+        match = challvalidsre.match(text(valids))
+        if match is not None:
+            rec['valids'] = int(match.group(1))
+            break
+
+    # Parse nickname and date of last validation
+    rec['lastvalid'] = None
+    if not devnull and rec['valids'] > 0:
+        [lastvalid] = content.xpath(u'.//*[contains(text(), "Dernière validation par")]')
+        match = challlastvalidre.match(text(lastvalid))
+        (lastvalidname, lastvaliddate) = match.groups()
+        date = datetime.datetime.strptime(lastvaliddate, "%d/%m/%Y à %H:%M")
+        rec['lastvalid'] = (lastvalidname, int(date.strftime("%s")))
+
+    # Parse the number of points
+    rec['pts'] = None
+    if not devnull:
+        # Some challenges are fucky
+        for points in content.xpath(u'.//*[contains(text(), "point")]'):
+            match = challptsre.match(text(points))
+            if match is not None:
+                rec['pts'] = int(match.group(1))
+
+    # Parse quality
+    rec['quality'] = None
+    if not devnull:
+        [img] = content.cssselect('img[src *= "challs_ranks"]')
+        match = challqualityre.match(img.get('title'))
+        rec['quality'] = float(match.group(1))
+
+    # Parse help url
+    [link] = content.xpath('.//a[img/@alt="Aide"]')
+    rec['helpurl'] = link.get('href')
+
+    # Parse afterwards url (if any)
+    rec['afterurl'] = None
+    if rec['status'] == 'valid':
+        [link] = content.xpath('.//a[img/@alt="Afterwards"]')
+        rec['afterurl'] = link.get('href')
+
+    # Parse the vote
+    rec['voteurl'] = None
+    rec['vote'] = None
+    if rec['status'] == 'valid':
+        [form] = content.cssselect('form[name *= "polling"]')
+        rec['voteurl'] = form.get('action')
+        [option] = form.cssselect('option[selected]')
+        rec['vote'] = option.get('value')
+
+    # Parse the challenge description
+    desc = copy.deepcopy(content)
+    # Remove everything up to (and including) the first <h2> element
+    while len(desc) > 0 and desc[0].tag != 'h2':
+        desc.remove(desc[0])
+    if len(desc) > 0 and desc[0].tag == 'h2':
+        desc.remove(desc[0])
+    # Remove the end up to the second last <hr> if the challenged is not /dev/nulled
+    if not devnull:
+        for _ in range(2):
+            while len(desc) > 0 and desc[-1].tag != 'hr':
+                desc.remove(desc[-1])
+            if len(desc) > 0 and desc[-1].tag == 'hr':
+                desc.remove(desc[-1])
+
+    rec['deschtml'] = lxml.html.tostring(desc)
+    rec['words'] = words(name + " " + text(desc))
+    desc.make_links_absolute(url)
+    rec['desclinks'] = lxml.html.tostring(desc, method = 'html')
+    return rec
+
+
+
+catvalidsre = re.compile('^doGraph\((\d+),')
+catptsre = re.compile('^(\d+) point')
+catvotere = re.compile('^([0-9.]+) / 10')
+
+def category(content, url):
+    """Extract the challenge list of a category as tuples (name, url, status,
+    validations, points, quality, date)."""
+
+    doc = lxml.html.fromstring(content, base_url = url)
+    tables = doc.cssselect('div#content > div.textpad > table')
+
+    # There might be table before the right one for the newest challenges
+    table = tables[-1]
+
+    rows = []
+
+    for row in table.cssselect('tr'):
+        # The first row only contains the column headers
+        if len(row.cssselect('th')) > 0:
+            continue
+
+        [tdlink, tdvalids, tdpts, tdvote, tddate] = row.cssselect('td')
+
+        # Parse link and challenge name
+        [link] = tdlink.cssselect('a')
+        challname = text(link).replace('/', '_')
+        challurl = link.get('href')
+
+        # Parse validation status (validated, not validated, devnull)
+        [img] = tdvalids.cssselect('img')
+        statusimg = img.get('src')
+        status = 'unknown'
+        if 'nullvalide' in statusimg:
+            status = 'devnull'
+        elif 'nonvalide' in statusimg:
+            status = 'nonvalid'
+        elif 'valide' in statusimg:
+            status = 'valid'
+
+        # Parse validations
+        [script] = tdvalids.cssselect('script')
+        match = catvalidsre.match(script.text)
+        validscnt = int(match.group(1))
+
+        # Parse points
+        match = catptsre.match(tdpts.text)
+        points = int(match.group(1))
+
+        # Parse votes
+        [img] = tdvote.cssselect('img')
+        match = catvotere.match(img.get('title'))
+        votes = float(match.group(1))
+
+        # Parse date
+        date = time.strptime(tddate.text, "%d/%m/%Y")
+        date = time.mktime(date)
+
+        rows.append((challname, challurl, status, validscnt, points, votes, date))
+
+    return rows
+
+
+
+nchallsre = re.compile('^\d+ / (\d+)')
+
+def categories(content, url):
+    """Extract the list of categories as tuples (name, url, challenge
+    count)."""
+
+    doc = lxml.html.fromstring(content, base_url = url)
+    tables = doc.cssselect('div#content > div.textpad > table')
+
+    if len(tables) != 3:
+        raise ParsingException()
+
+    rows = []
+
+    # Categories are linked in the first table
+    for row in tables[0].cssselect('tr'):
+        [tdlink, tdcount] = row.cssselect('td')
+
+        # Parse the link and category name
+        [link] = tdlink.cssselect('strong a')
+        caturl = link.get('href')
+        catname = text(link).strip()
+
+        if catname.startswith('Épreuves '):
+            catname = catname[len('Épreuves '):]
+
+        # Parse the challenge count
+        match = nchallsre.match(text(tdcount))
+        nchalls = int(match.group(1))
+
+        rows.append((catname, caturl, nchalls))
+
+    return rows
+
+
+
+def news(content, url):
+    """Extract the news as tuples (title, HTML content, date text)."""
+
+    doc = lxml.html.fromstring(content, base_url = url)
+    elements = doc.cssselect('div#content > div.textpad > *')
+
+    rows = []
+
+    for i in range(0, len(elements), 4):
+        # The list end with a single <p>
+        if i + 4 > len(elements):
+            break
+
+        [title, content, foot, hr] = elements[i:i+4]
+        if title.tag != 'h2' or hr.tag != 'hr':
+            raise ParsingException()
+
+        titletext = title.text
+        titletext = titletext.strip().replace('/', '_')
+        htmlcontent = lxml.html.tostring(content, method = 'html')
+        rows.append((titletext, htmlcontent, text(foot)))
+
+    return rows
+
+
+
+def vote(content, url):
+    """Extract the message displayed after a vote."""
+
+    doc = lxml.html.fromstring(content, base_url = url)
+    [content] = doc.cssselect('div#content > div.textpad')
+    [h2] = content.cssselect('h2')
+    return text(h2)
+
+
+
+def _extract(func, content, url):
+    """Run func in a process of the pool. The exceptions are returned rather
+    than raised since the pool only forwards the subclasses of Exception and
+    its worker dies on the others, like ParsingException."""
+    try:
+        return (None, func(content, url))
+    except BaseException as e:
+        return (e, None)
+
+
+
+class PageParser(object):
+    """Run the extraction functions in the calling thread or in a pool of
+    processes so that several pages can be parsed at once."""
+
+    def __init__(self):
+        self.pool = None
+
+
+    def startpool(self, nprocs):
+        """Run the next extractions in nprocs processes. Has to be called
+        after fuse daemonized."""
+        self.pool = multiprocessing.Pool(nprocs)
+
+
+    def stoppool(self):
+        pool = self.pool
+        self.pool = None
+        if pool is not None:
+            pool.terminate()
+
+
+    def parse(self, func, res):
+        """Extract the records of the response res with func."""
+        pool = self.pool
+        with metrics.timer("parse." + func.__name__):
+            if pool is None:
+                return func(res.content, res.url)
+
+            job = pool.apply_async(_extract, (func, res.content, res.url))
+            try:
+                (e, rec) = job.get(deadline.remaining())
+            except multiprocessing.TimeoutError:
+                raise deadline.DeadlineExceeded()
+
+            if e is not None:
+                raise e
+            return rec
+
+
+
+parser = PageParser()
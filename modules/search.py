@@ -0,0 +1,171 @@
+# coding: utf-8
+
+import os
+import errno
+import marshal
+import threading
+
+import fuse
+import pages
+import fileobjects as fo
+from . import FSModule
+
+
+
+class SearchIndex(object):
+    """An inverted index associating each word with the paths of the
+    challenges (category/challenge) whose name or description contains it.
+    It's updated each time a challenge list or page is parsed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.docs = {}
+
+
+    # Must be called with self.lock held
+    def _remove(self, path):
+        for w in self.docs.pop(path, ()):
+            paths = self.postings[w]
+            paths.discard(path)
+            if len(paths) == 0:
+                del self.postings[w]
+
+
+    def update(self, path, words):
+        """Replace the words indexed for path."""
+        with self.lock:
+            self._remove(path)
+            self.docs[path] = words
+            for w in words:
+                self.postings.setdefault(w, set()).add(path)
+
+
+    def add(self, path, words):
+        """Index path with words unless it's already indexed, usually with
+        more words."""
+        with self.lock:
+            if path in self.docs:
+                return
+        self.update(path, words)
+
+
+    def prune(self, prefix, keep):
+        """Remove the paths starting with prefix that are not in keep."""
+        with self.lock:
+            for path in self.docs.keys():
+                if path.startswith(prefix) and path not in keep:
+                    self._remove(path)
+
+
+    def search(self, query):
+        """Return the set of the paths containing all the words of query."""
+        words = pages.words(query)
+        if len(words) == 0:
+            return set()
+
+        with self.lock:
+            postings = [self.postings.get(w, ()) for w in words]
+            postings.sort(key = len)
+            result = set(postings[0])
+            for p in postings[1:]:
+                result.intersection_update(p)
+                if len(result) == 0:
+                    break
+            return result
+
+
+    def load(self, path):
+        """Load the index saved in the file path if it exists."""
+        try:
+            with open(path, "rb") as f:
+                docs = marshal.load(f)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+
+        for (p, words) in docs.items():
+            self.update(p, words)
+
+
+    def save(self, path):
+        with self.lock:
+            docs = dict(self.docs)
+
+        tmppath = path + ".tmp"
+        with open(tmppath, "wb") as f:
+            marshal.dump(docs, f)
+        os.rename(tmppath, path)
+
+
+    def stats(self):
+        with self.lock:
+            return {'words': len(self.postings), 'challenges': len(self.docs)}
+
+
+
+class Search(FSModule):
+    """This class is responsible for the directory /search. Each directory
+    /search/<query> contains a symbolic link to the directory of every
+    challenge matching the words of the query."""
+
+    def __init__(self, index):
+        super(Search, self).__init__()
+        self.index = index
+
+
+    def links(self, query):
+        """Return a dict associating the link names with their targets. The
+        links are named after the challenges, and after their category as
+        well when two challenges have the same name."""
+        cats = {}
+        for p in self.index.search(query):
+            (cat, chall) = p.split("/", 1)
+            cats.setdefault(chall, []).append(cat)
+
+        links = {}
+        for (chall, catlist) in cats.items():
+            for cat in catlist:
+                name = chall if len(catlist) == 1 else "%s (%s)" % (chall, cat)
+                links[name] = "../../challenges/%s/%s" % (cat, chall)
+        return links
+
+
+    def getattr(self, path):
+        (query, _, name) = path.partition("/")
+        if name == "":
+            return fo.DirStat()
+
+        target = self.links(query).get(name)
+        if target is None:
+            return -errno.ENOENT
+        return fo.LinkStat(target)
+
+
+    def readdir(self, path, offset):
+        if path == "":
+            return []
+
+        (query, _, name) = path.partition("/")
+        if name != "":
+            return -errno.ENOTDIR
+        return [fuse.Direntry(n) for n in self.links(query)]
+
+
+    def open(self, path, flags):
+        if "/" not in path:
+            return -errno.EISDIR
+        return -errno.ENOENT
+
+
+    def readlink(self, path):
+        (query, _, name) = path.partition("/")
+        target = self.links(query).get(name)
+        if target is None:
+            return -errno.ENOENT
+        return target
+
+
+
+index = SearchIndex()
@@ -0,0 +1,214 @@
+# coding: utf-8
+
+import os
+import mmap
+import stat
+import errno
+import fuse
+import struct
+import marshal
+import threading
+
+import fileobjects as fo
+from authrequests import AuthException
+from . import ParsingException, FSModule
+
+
+
+# A snapshot file starts with the magic string and the offset of the index.
+# The contents of the files follow. The index is a marshaled dict associating
+# each path with a tuple (mode, nlink, size, mtime, ctime, offset).
+MAGIC = b"NCFSSNAP1\n"
+HEADER = struct.Struct("<Q")
+
+
+
+class Exporter(object):
+    """Walk a module and save all its directories and files in a snapshot
+    file. The paths in exclude aren't saved. Only one export can run at a
+    time."""
+
+    chunksize = 2**16
+
+    def __init__(self, root = None, exclude = ()):
+        self.root = root
+        self.exclude = set(exclude)
+        self.lock = threading.Lock()
+        self.state = 'idle'
+        self.path = None
+        self.count = 0
+        self.error = None
+
+
+    def start(self, path):
+        """Export in background to path. Return False if one is running."""
+        with self.lock:
+            if self.state == 'running':
+                return False
+            self.state = 'running'
+            self.path = path
+            self.count = 0
+            self.error = None
+
+        thread = threading.Thread(target = self.run, args = (path,), name = "exporter")
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+    def run(self, path):
+        try:
+            self.export(path)
+            state = 'done'
+        except (Exception, ParsingException, AuthException) as e:
+            self.error = repr(e)
+            state = 'failed'
+
+        with self.lock:
+            self.state = state
+
+
+    def walk(self, path):
+        """Generate a tuple (path, stat) for path and everything below."""
+        st = self.root.getattr(path)
+        if isinstance(st, int):
+            return
+        yield (path, st)
+
+        if not st.st_mode & stat.S_IFDIR:
+            return
+
+        for entry in self.root.readdir(path, 0):
+            if entry.name in (".", ".."):
+                continue
+            sub = path + "/" + entry.name if path != "" else entry.name
+            if sub in self.exclude:
+                continue
+            for x in self.walk(sub):
+                yield x
+
+
+    def readall(self, path):
+        """Return the whole content of the file path, or None if it can't be
+        read. The size given by its stat may be a placeholder."""
+        chunks = []
+        offset = 0
+        while True:
+            buf = self.root.read(path, self.chunksize, offset)
+            if isinstance(buf, int):
+                return None
+            if len(buf) == 0:
+                return b"".join(chunks)
+            chunks.append(buf)
+            offset += len(buf)
+
+
+    def export(self, path):
+        index = {}
+        tmppath = path + ".tmp"
+
+        with open(tmppath, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(0))
+
+            for (p, st) in self.walk(""):
+                mode = st.st_mode & ~0222
+                if st.st_mode & stat.S_IFDIR:
+                    index[p] = (mode, st.st_nlink, 0, st.st_mtime, st.st_ctime, 0)
+                    continue
+
+                content = self.readall(p)
+                if content is None:
+                    continue
+                index[p] = (mode, st.st_nlink, len(content), st.st_mtime,
+                        st.st_ctime, f.tell())
+                f.write(content)
+                self.count += 1
+
+            indexoffset = f.tell()
+            marshal.dump(index, f)
+            f.seek(len(MAGIC))
+            f.write(HEADER.pack(indexoffset))
+
+        os.rename(tmppath, path)
+
+
+    def status(self):
+        with self.lock:
+            status = "state: %s\n" % self.state
+            if self.path is not None:
+                status += "path: %s\n" % self.path
+            status += "files: %d\n" % self.count
+            if self.error is not None:
+                status += "error: %s\n" % self.error
+            return bytes(status)
+
+
+
+class Snapshot(FSModule):
+    """Serve read-only the content of a snapshot file. The file is mapped in
+    memory, only the index is loaded at startup."""
+
+    def __init__(self, path, *args, **kwargs):
+        super(Snapshot, self).__init__(*args, **kwargs)
+
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a snapshot file" % path)
+
+        (indexoffset,) = HEADER.unpack_from(self.mm, len(MAGIC))
+        self.index = marshal.loads(self.mm[indexoffset:])
+
+        # Associate each directory with the names it contains
+        self.children = {}
+        for p in self.index:
+            if p == "":
+                continue
+            (parent, _, name) = p.rpartition("/")
+            self.children.setdefault(parent, []).append(name)
+
+
+    def getattr(self, path):
+        entry = self.index.get(path)
+        if entry is None:
+            return -errno.ENOENT
+
+        st = fo.DefaultStat()
+        (st.st_mode, st.st_nlink, st.st_size, st.st_mtime, st.st_ctime, _) = entry
+        st.st_atime = st.st_mtime
+        return st
+
+
+    def readdir(self, path, offset):
+        return [fuse.Direntry(name) for name in self.children.get(path, [])]
+
+
+    def open(self, path, flags):
+        entry = self.index.get(path)
+        if entry is None:
+            return -errno.ENOENT
+        if entry[0] & stat.S_IFDIR:
+            return -errno.EISDIR
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return -errno.EROFS
+
+
+    def read(self, path, size, offset):
+        entry = self.index.get(path)
+        if entry is None:
+            return -errno.ENOENT
+
+        (_, _, length, _, _, start) = entry
+        offset = min(offset, length)
+        end = min(offset + size, length)
+        return self.mm[start+offset:start+end]
+
+
+    def write(self, path, *args, **kwargs):
+        return -errno.EROFS
+
+
+    def truncate(self, path, *args, **kwargs):
+        return -errno.EROFS
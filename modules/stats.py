@@ -0,0 +1,58 @@
+# coding: utf-8
+
+import json
+
+import metrics
+import scheduler as sched
+import membudget as mb
+import fileobjects as fo
+import htmlconverter as hc
+import votes
+import search
+from . import FSSubModuleFiles
+
+
+
+class Stats(FSSubModuleFiles):
+    """This class is responsible for the virtual files /.stats and
+    /.stats.json."""
+
+    def __init__(self, *args, **kwargs):
+        super(Stats, self).__init__(*args, **kwargs)
+
+        sf = fo.DynamicFile(".stats", provider = self.rendertext)
+        jf = fo.DynamicFile(".stats.json", provider = self.renderjson)
+        self.files = {}
+        for f in [sf, jf]:
+            self.files[f.name] = f
+
+
+    def rendertext(self):
+        lines = []
+        for (k, v) in sorted(hc.converter.stats().items()):
+            lines.append("htmlconverter.%s %s\n" % (k, v))
+        for (k, v) in sorted(mb.budget.resident().items()):
+            lines.append("resident.%s %d\n" % (k, v))
+        for (k, v) in sorted(sched.fetches.stats().items()):
+            lines.append("scheduler.%s %s\n" % (k, v))
+        for (k, v) in sorted(votes.queue.stats().items()):
+            lines.append("votes.%s %d\n" % (k, v))
+        for (k, v) in sorted(search.index.stats().items()):
+            lines.append("search.%s %d\n" % (k, v))
+
+        if not metrics.enabled:
+            lines.append("# mount with -o stats for more statistics\n")
+            return b"".join(lines)
+
+        return b"".join(lines) + metrics.registry.rendertext()
+
+
+    def renderjson(self):
+        d = {'htmlconverter': hc.converter.stats()}
+        d['resident'] = mb.budget.resident()
+        d['scheduler'] = sched.fetches.stats()
+        d['votes'] = votes.queue.stats()
+        d['search'] = search.index.stats()
+        if metrics.enabled:
+            d.update(metrics.registry.todict())
+        return json.dumps(d, sort_keys = True, indent = 1) + "\n"
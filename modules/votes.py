@@ -0,0 +1,111 @@
+# coding: utf-8
+
+import os
+import time
+import threading
+import collections
+
+import metrics
+import scheduler as sched
+from authrequests import AuthException
+
+
+
+class VoteQueue(object):
+    """Send the votes in background threads. A vote written for a challenge
+    while its previous one is still waiting replaces it. The state of the last
+    vote of each challenge is kept in its attribute votestatus."""
+
+    concurrency = 2
+
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.pending = collections.OrderedDict()
+        self.sending = set()
+        self.threads = []
+
+
+    def submit(self, chall, vote):
+        with self.cond:
+            # Keep the place in the queue of a vote being replaced
+            self.pending[chall] = vote
+            chall.votestatus = "pending %s" % vote
+            self.cond.notify()
+
+            if len(self.threads) < self.concurrency:
+                t = threading.Thread(target = self.run, name = "votes")
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+
+
+    # Must be called with self.cond locked
+    def _next(self):
+        """Return the first challenge whose previous vote is not being
+        sent, or None."""
+        for chall in self.pending:
+            if chall not in self.sending:
+                return chall
+        return None
+
+
+    def run(self):
+        with sched.priority('vote'):
+            while True:
+                with self.cond:
+                    chall = self._next()
+                    while chall is None:
+                        self.cond.wait()
+                        chall = self._next()
+
+                    vote = self.pending.pop(chall)
+                    self.sending.add(chall)
+                    chall.votestatus = "sending %s" % vote
+
+                status = self.send(chall, vote)
+
+                with self.cond:
+                    self.sending.discard(chall)
+                    # A newer vote may be waiting for another thread
+                    if chall not in self.pending:
+                        chall.votestatus = status
+                    self.cond.notify_all()
+
+
+    def send(self, chall, vote):
+        """Send a vote and return its status."""
+        try:
+            ret = chall.send_vote(vote)
+        except (Exception, AuthException) as e:
+            metrics.incr("vote.failed")
+            return "failed %s: %r" % (vote, e)
+
+        if ret is not None:
+            metrics.incr("vote.failed")
+            return "failed %s: %s" % (vote, os.strerror(-ret))
+
+        metrics.incr("vote.sent")
+        # The quality and the vote shown on the page changed
+        chall.invalidate()
+        return "sent %s" % vote
+
+
+    def wait(self, timeout):
+        """Wait at most timeout seconds for the votes to be sent."""
+        end = time.time() + timeout
+        with self.cond:
+            while len(self.pending) > 0 or len(self.sending) > 0:
+                left = end - time.time()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+
+    def stats(self):
+        with self.cond:
+            return {'pending': len(self.pending), 'sending': len(self.sending)}
+
+
+
+queue = VoteQueue()
@@ -1,12 +1,27 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
 import fuse
+import errno
 import itertools
+import contextlib
 
+import metrics
+import deadline
+import scheduler as sched
+import fileobjects as fo
+import htmlconverter as hc
 import modules
 import modules.news as news
+import modules.pages as pages
+import modules.votes as votes
+import modules.search as search
+import modules.stats as stats
 import modules.challenges as challenges
+import modules.control as control
+import modules.crawler as crawler
+import modules.snapshot as snapshot
 import modules.authrequests as authrequests
 
 fuse.fuse_python_api = (0, 2)
@@ -15,45 +30,125 @@ fuse.fuse_python_api = (0, 2)
 
 
 class NewbiecontestFS(fuse.Fuse):
-    def __init__(self, *args, **kwargs):
-        super(NewbiecontestFS, self).__init__(*args, **kwargs)
+    def setup(self):
+        """Build the modules according to the parsed options."""
+        self.crawler = None
 
-        req = authrequests.AuthRequests()
-        rootmodule = authrequests.Auth(req)
+        if self.snapshot is not None:
+            # Offline mode, never use the network
+            self.rootfsmodule = snapshot.Snapshot(self.snapshot)
+            return
+
+        req = authrequests.AuthRequests(self.urlbase)
+        for (name, (_, setter, _)) in control.settings(req).items():
+            val = getattr(self, name)
+            if val is not None:
+                setter(val)
+
+        rootmodule = authrequests.Auth(req, rootmodule = stats.Stats())
 
         dirmodules = {}
         dirmodules["news"] = news.News(req)
         dirmodules["challenges"] = challenges.Challenges(req)
+        dirmodules["search"] = search.Search(search.index)
+
+        if self.searchindex is not None:
+            search.index.load(self.searchindex)
+
+        root = modules.FSSubModule(rootmodule, dirmodules)
+
+        self.crawler = crawler.Crawler(dirmodules["challenges"], self.warmthreads)
+        exporter = snapshot.Exporter(root, [".control", ".stats", ".stats.json"])
+        dirmodules[".control"] = control.Control(self.crawler, exporter, req, root)
 
-        self.rootfsmodule = modules.FSSubModule(rootmodule, dirmodules)
+        self.rootfsmodule = root
 
 
+    def fsinit(self):
+        # Processes can only be started once fuse has daemonized
+        if self.htmlprocs > 0:
+            hc.converter.startpool(self.htmlprocs)
+        if self.parseprocs > 0:
+            pages.parser.startpool(self.parseprocs)
+
+        if self.warm and self.crawler is not None:
+            self.crawler.start()
+
+    def fsdestroy(self):
+        # Give a chance to the votes written just before unmounting
+        votes.queue.wait(10)
+        if self.searchindex is not None and self.snapshot is None:
+            search.index.save(self.searchindex)
+        hc.converter.stoppool()
+        pages.parser.stoppool()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def operation(name, path):
+        """Time a fuse operation, bound it in time and make its requests go
+        before the background ones."""
+        with metrics.timer("fuse." + name, path), deadline.bound(), sched.priority('interactive'):
+            yield
+
     def getattr(self, path):
-        path = path[1:]
-        return self.rootfsmodule.getattr(path)
+        with self.operation("getattr", path):
+            path = path[1:]
+            return self.rootfsmodule.getattr(path)
 
     def readdir(self, path, offset):
-        path = path[1:]
-        dotdot = [fuse.Direntry("."), fuse.Direntry("..")]
-        f = self.rootfsmodule.readdir(path, offset)
-        return itertools.chain(dotdot, f)
+        with self.operation("readdir", path):
+            path = path[1:]
+            dotdot = [fuse.Direntry("."), fuse.Direntry("..")]
+            f = self.rootfsmodule.readdir(path, offset)
+            return itertools.chain(dotdot, f)
 
     def open(self, path, *args, **kwargs):
-        path = path[1:]
-        return self.rootfsmodule.open(path, *args, **kwargs)
+        with self.operation("open", path):
+            path = path[1:]
+            return self.rootfsmodule.open(path, *args, **kwargs)
 
     def read(self, path, *args, **kwargs):
-        path = path[1:]
-        return self.rootfsmodule.read(path, *args, **kwargs)
+        with self.operation("read", path):
+            path = path[1:]
+            return self.rootfsmodule.read(path, *args, **kwargs)
+
+    def readlink(self, path):
+        with self.operation("readlink", path):
+            path = path[1:]
+            return self.rootfsmodule.readlink(path)
+
+    def getxattr(self, path, name, size):
+        with self.operation("getxattr", path):
+            path = path[1:]
+            val = self.rootfsmodule.getxattr(path, name)
+            if isinstance(val, int) or size > 0:
+                return val
+            return len(val)
+
+    def listxattr(self, path, size):
+        with self.operation("listxattr", path):
+            path = path[1:]
+            names = self.rootfsmodule.listxattr(path)
+            if isinstance(names, int):
+                return names
+
+            # Each name is followed by a NUL byte
+            length = sum(len(n) + 1 for n in names)
+            if size == 0:
+                return length
+            if size < length:
+                return -errno.ERANGE
+            return names
 
     def write(self, path, *args, **kwargs):
-        path = path[1:]
-        return self.rootfsmodule.write(path, *args, **kwargs)
+        with self.operation("write", path):
+            path = path[1:]
+            return self.rootfsmodule.write(path, *args, **kwargs)
 
     def truncate(self, path, *args, **kwargs):
-        path = path[1:]
-        return self.rootfsmodule.truncate(path, *args, **kwargs)
-
+        with self.operation("truncate", path):
+            path = path[1:]
+            return self.rootfsmodule.truncate(path, *args, **kwargs)
 
 
 def main():
@@ -61,8 +156,43 @@ def main():
     usage += NewbiecontestFS.fusage
 
     server = NewbiecontestFS(usage = usage)
-    args = server.parse(errex = 1)
+    server.parser.add_option(mountopt = "noatime", action = "store_true",
+            default = False, help = "never update the access time of the files")
+    server.parser.add_option(mountopt = "htmlprocs", metavar = "N", type = "int",
+            default = 0, help = "convert HTML to text in N processes [default: %default]")
+    server.parser.add_option(mountopt = "parseprocs", metavar = "N", type = "int",
+            default = 0, help = "parse the pages in N processes [default: %default]")
+    server.parser.add_option(mountopt = "warm", action = "store_true",
+            default = False, help = "fetch all the challenges at startup")
+    server.parser.add_option(mountopt = "warmthreads", metavar = "N", type = "int",
+            default = 8, help = "fetch N pages in parallel when warming [default: %default]")
+    server.parser.add_option(mountopt = "snapshot", metavar = "FILE",
+            help = "serve read-only the snapshot FILE without network")
+    server.parser.add_option(mountopt = "urlbase", metavar = "URL",
+            help = "use the site at URL instead of %s" % authrequests.AuthRequests.urlbase)
+    server.parser.add_option(mountopt = "searchindex", metavar = "FILE",
+            help = "keep the search index in FILE between mounts")
+    server.parser.add_option(mountopt = "stats", action = "store_true",
+            default = False, help = "record statistics readable in /.stats")
+    server.parser.add_option(mountopt = "slowlog", metavar = "FILE",
+            help = "trace the operations and log the slow ones in FILE")
+    server.parser.add_option(mountopt = "slowthreshold", metavar = "SECS",
+            type = "float", default = 1.0,
+            help = "log the operations slower than SECS [default: %default]")
+    for (name, t, metavar, h) in control.settingshelp:
+        server.parser.add_option(mountopt = name, type = t, metavar = metavar, help = h)
+    args = server.parse(values = server, errex = 1)
     args.add('default_permissions')
+    # The daemon changes its working directory to /
+    if server.searchindex is not None:
+        server.searchindex = os.path.abspath(server.searchindex)
+    if server.slowlog is not None:
+        server.slowlog = os.path.abspath(server.slowlog)
+    fo.noatime = server.noatime
+    metrics.enabled = server.stats
+    metrics.slowlog = server.slowlog
+    metrics.slowthreshold = server.slowthreshold
+    server.setup()
     server.main()
 
 
@@ -0,0 +1,80 @@
+# coding: utf-8
+
+import os
+import sys
+import time
+import thread
+import threading
+
+
+
+class SamplingProfiler(object):
+    """Sample the stacks of all the threads at regular intervals for some
+    time. The stacks are counted in the collapsed format used by the flame
+    graph tools: the functions separated by ';' followed by the count."""
+
+    def __init__(self, interval = 0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.state = 'idle'
+        self.counts = {}
+        self.nsamples = 0
+
+
+    def start(self, duration):
+        """Sample for duration seconds in background. Return False if a
+        profiling is already running."""
+        with self.lock:
+            if self.state == 'running':
+                return False
+            self.state = 'running'
+            self.counts = {}
+            self.nsamples = 0
+
+        t = threading.Thread(target = self.run, args = (duration,), name = "profiler")
+        t.daemon = True
+        t.start()
+        return True
+
+
+    def sample(self, me):
+        for (tid, frame) in sys._current_frames().items():
+            if tid == me:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append("%s:%s" % (filename, code.co_name))
+                frame = frame.f_back
+
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+    def run(self, duration):
+        me = thread.get_ident()
+        end = time.time() + duration
+
+        while time.time() < end:
+            with self.lock:
+                self.sample(me)
+                self.nsamples += 1
+            time.sleep(self.interval)
+
+        with self.lock:
+            self.state = 'done'
+
+
+    def status(self):
+        with self.lock:
+            lines = ["# state: %s, samples: %d\n" % (self.state, self.nsamples)]
+            counts = sorted(self.counts.items(), key = lambda x: -x[1])
+            for (stack, n) in counts:
+                lines.append("%s %d\n" % (stack, n))
+            return b"".join(lines)
+
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,214 @@
+# coding: utf-8
+
+import time
+import thread
+import threading
+import contextlib
+import collections
+
+import metrics
+
+
+
+# The priority classes, the most urgent first
+classes = ['auth', 'interactive', 'vote', 'refresh', 'prefetch']
+
+# The class of the threads that didn't choose one
+defaultclass = 'refresh'
+
+_tls = threading.local()
+
+
+
+@contextlib.contextmanager
+def priority(cls):
+    """Context manager setting the priority class of the requests made by the
+    current thread."""
+    prev = current()
+    _tls.cls = cls
+    try:
+        yield
+    finally:
+        _tls.cls = prev
+
+
+def current():
+    return getattr(_tls, 'cls', defaultclass)
+
+
+def urgent(a, b):
+    """Return the most urgent of the classes a and b. Either can be None."""
+    if a is None or (b is not None and classes.index(b) < classes.index(a)):
+        return b
+    return a
+
+
+
+class Scheduler(object):
+    """A semaphore whose slots are given to the waiting threads by priority
+    class rather than in arrival order. Each class can be limited to a number
+    of slots. A thread waiting for longer than maxwait is served before the
+    more urgent classes so that none is starved. A thread can be boosted to
+    a more urgent class while a more urgent one waits for its work. The
+    number of slots can be changed while it's used. Usable with "with"."""
+
+    def __init__(self, size = 20, maxwait = 10):
+        self.cond = threading.Condition(threading.Lock())
+        self.size = size
+        self.maxwait = maxwait
+        self.used = 0
+
+        # Keep some slots for the interactive requests
+        self.caps = {'vote': 4, 'refresh': 8, 'prefetch': 8}
+
+        self.queues = dict((c, collections.deque()) for c in classes)
+        self.running = dict((c, 0) for c in classes)
+        self.granted = dict((c, 0) for c in classes)
+        self.waittime = dict((c, 0.0) for c in classes)
+
+        # The class and the queue entry of the waiting threads, and the class
+        # of the boosted threads, by thread id
+        self.waiting = {}
+        self.boosts = {}
+
+        # The slots taken by each thread, to release the right class
+        self.tls = threading.local()
+
+
+    # Must be called with self.cond locked
+    def _capped(self, cls):
+        cap = self.caps.get(cls)
+        return cap is not None and self.running[cls] >= cap
+
+
+    # Must be called with self.cond locked
+    def _next(self):
+        """Return the ticket of the thread to serve next, or None."""
+        if self.used >= self.size:
+            return None
+
+        now = time.time()
+        best = None
+        oldest = None
+        for cls in classes:
+            q = self.queues[cls]
+            if len(q) == 0 or self._capped(cls):
+                continue
+
+            (start, ticket) = q[0]
+            if best is None:
+                best = ticket
+
+            if now - start > self.maxwait and (oldest is None or start < oldest[0]):
+                oldest = (start, ticket)
+
+        if oldest is not None:
+            return oldest[1]
+        return best
+
+
+    def acquire(self, timeout = None):
+        """Take a slot for the priority class of the current thread, waiting
+        at most timeout seconds if given. Return whether a slot was taken."""
+        ident = thread.get_ident()
+        start = time.time()
+        ticket = object()
+
+        with self.cond:
+            cls = urgent(current(), self.boosts.get(ident))
+            entry = (start, ticket)
+            self.queues[cls].append(entry)
+            self.waiting[ident] = (cls, entry)
+
+            while self._next() is not ticket:
+                # Wake up regularly to check for starvation
+                wait = self.maxwait
+                if timeout is not None:
+                    left = start + timeout - time.time()
+                    if left <= 0:
+                        (cls, _) = self.waiting.pop(ident)
+                        self.queues[cls].remove(entry)
+                        self.cond.notify_all()
+                        return False
+                    wait = min(wait, left)
+                self.cond.wait(wait)
+
+            # The thread might have been boosted while waiting
+            (cls, _) = self.waiting.pop(ident)
+            self.queues[cls].popleft()
+            self.used += 1
+            self.running[cls] += 1
+            self.granted[cls] += 1
+            elapsed = time.time() - start
+            self.waittime[cls] += elapsed
+
+            # The next thread might be served as well
+            self.cond.notify_all()
+
+        held = getattr(self.tls, 'held', None)
+        if held is None:
+            held = self.tls.held = []
+        held.append(cls)
+        metrics.observe("wait.sched.%s" % cls, elapsed)
+        return True
+
+    __enter__ = acquire
+
+    def release(self):
+        cls = self.tls.held.pop()
+        with self.cond:
+            self.used -= 1
+            self.running[cls] -= 1
+            self.cond.notify_all()
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+    def boost(self, ident, cls):
+        """Serve the thread ident at least as the class cls until unboost is
+        called, including the request it's currently waiting for."""
+        with self.cond:
+            cls = urgent(self.boosts.get(ident), cls)
+            self.boosts[ident] = cls
+
+            if ident not in self.waiting:
+                return
+            (prev, entry) = self.waiting[ident]
+            if urgent(prev, cls) == prev:
+                return
+
+            # Move its entry to the new queue, in arrival order
+            self.queues[prev].remove(entry)
+            newq = list(self.queues[cls])
+            newq.append(entry)
+            newq.sort(key = lambda e: e[0])
+            self.queues[cls] = collections.deque(newq)
+            self.waiting[ident] = (cls, entry)
+            self.cond.notify_all()
+
+
+    def unboost(self, ident):
+        with self.cond:
+            self.boosts.pop(ident, None)
+
+
+    def resize(self, size):
+        with self.cond:
+            self.size = size
+            self.cond.notify_all()
+
+
+    def stats(self):
+        with self.cond:
+            d = {'size': self.size, 'used': self.used}
+            for cls in classes:
+                granted = self.granted[cls]
+                d[cls + '.queued'] = len(self.queues[cls])
+                d[cls + '.running'] = self.running[cls]
+                d[cls + '.granted'] = granted
+                d[cls + '.meanwait'] = self.waittime[cls] / granted if granted > 0 else 0.0
+            return d
+
+
+
+fetches = Scheduler()
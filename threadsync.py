@@ -1,5 +1,6 @@
 # coding: utf-8
 
+import time
 import threading
 import contextlib
 
@@ -36,8 +37,25 @@ class RWLock(object):
             self.writing = False
 
 
+    class Reader(object):
+        """The read side of a RWLock as a lock whose acquire accepts a
+        timeout, usable with deadline.Bounded."""
+
+        __slots__ = ('rwlock',)
+
+        def __init__(self, rwlock):
+            self.rwlock = rwlock
+
+        def acquire(self, timeout = None):
+            return self.rwlock.acquire_read(timeout)
+
+        def release(self):
+            self.rwlock.release_read()
+
+
     def __init__(self, mutex = None):
         self.mutex = mutex if mutex is not None else threading.Lock()
+        self.reader = self.Reader(self)
         self.readq = threading.Condition(self.mutex)
         self.writeq = threading.Condition(self.mutex)
         self.readercount = 0
@@ -49,18 +67,30 @@ class RWLock(object):
 
 
     # Must be called with self.mutex locked
-    def _acquire_read(self):
+    def _acquire_read(self, timeout = None):
+        end = None if timeout is None else time.time() + timeout
+
         # Just wait for writers to wake us
         while self.writercount > 0:
-            self.readq.wait()
+            if end is None:
+                self.readq.wait()
+                continue
+
+            left = end - time.time()
+            if left <= 0:
+                return False
+            self.readq.wait(left)
+
         self.readercount += 1
         self.tls.reading = True
+        return True
 
-    def acquire_read(self):
-        """Acquire a reading lock."""
+    def acquire_read(self, timeout = None):
+        """Acquire a reading lock, waiting at most timeout seconds if given.
+        Return whether the lock was acquired."""
         assert(not self.tls.reading)
         with self.mutex:
-            self._acquire_read()
+            return self._acquire_read(timeout)
 
     __enter__ = acquire_read
 